@@ -0,0 +1,180 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Follow-ups like "can you explain that again?" only make sense with the conversation behind them
+_CONTEXT_WORDS = {
+    "it", "that", "this", "those", "these", "they", "them", "again", "above", "previous",
+    "earlier", "before", "last", "more", "another", "same", "else", "yes", "no", "ok", "okay",
+}
+
+# Words a rewording may add, drop or swap without changing the question; every other word has to match
+_FILLER_WORDS = {
+    "a", "an", "the", "is", "are", "am", "was", "were", "be", "s", "do", "does", "did", "of", "to",
+    "in", "on", "at", "for", "by", "with", "about", "please", "can", "could", "would", "you", "me", "i",
+}
+
+NUM_PERMUTATIONS = 32
+BANDS = 8  # 8 bands of 4 rows: pairs with Jaccard ~0.7+ almost always share a band
+_ROWS = NUM_PERMUTATIONS // BANDS
+_MAX_HASH = (1 << 61) - 1
+_SEEDS = [int.from_bytes(hashlib.blake2b(str(i).encode(), digest_size=8).digest(), "big") for i in range(NUM_PERMUTATIONS)]
+
+
+def normalize_question(text: str) -> str:
+    """Lower-case, strip punctuation and collapse whitespace: 'What is a Fraction?!' -> 'what is a fraction'."""
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def depends_on_conversation(normalized: str) -> bool:
+    words = normalized.split()
+    return len(words) < 3 or any(word in _CONTEXT_WORDS for word in words)
+
+
+def content_words(normalized: str) -> FrozenSet[str]:
+    """The words of a normalized question that carry its meaning, numbers included."""
+    return frozenset(word for word in normalized.split() if word not in _FILLER_WORDS)
+
+
+def _shingles(normalized: str, size: int = 3) -> Set[str]:
+    padded = f" {normalized} "
+    return {padded[i:i + size] for i in range(max(1, len(padded) - size + 1))}
+
+
+def _minhash(shingles: Set[str]) -> Tuple[int, ...]:
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles]
+    return tuple(min((h ^ seed) & _MAX_HASH for h in hashes) for seed in _SEEDS)
+
+
+def _similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERMUTATIONS
+
+
+@dataclass
+class _Entry:
+    answer: str
+    expires_at: float
+    signature: Optional[Tuple[int, ...]] = None
+    content: FrozenSet[str] = frozenset()
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of tutor answers keyed on (grade, module/subject, normalized question).
+
+    With `near_duplicates=True`, a miss on the exact key falls back to a MinHash/LSH
+    index over character shingles, so "what's a fraction" can reuse the answer to
+    "what is a fraction?" given at least `similarity` estimated Jaccard similarity.
+    Similar spelling is not enough on its own: the two questions must also have the
+    same content words (see `content_words`), so "what is 7x9" never gets the answer
+    to "what is 7x8", nor "austria" the answer about "australia".
+    """
+
+    def __init__(self, max_entries: int = 2000, ttl_seconds: float = 24 * 3600,
+                 near_duplicates: bool = False, similarity: float = 0.8):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.near_duplicates = near_duplicates
+        self.similarity = similarity
+        self._entries: "OrderedDict[Tuple[str, str, str], _Entry]" = OrderedDict()
+        self._bands: Dict[Tuple[str, str, int, Tuple[int, ...]], Set[Tuple[str, str, str]]] = {}
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @property
+    def stats(self) -> dict:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+        }
+
+    def cacheable(self, question: str, standalone: bool = True) -> bool:
+        """
+        False for questions asked partway through a conversation (`standalone` False)
+        and for follow-ups that read as depending on one; counted as a bypass.
+        """
+        if not standalone or depends_on_conversation(normalize_question(question)):
+            self.bypassed += 1
+            return False
+        return True
+
+    def get(self, question: str, grade: Optional[str], scope: Optional[str]) -> Optional[str]:
+        key = self._key(question, grade, scope)
+        entry = self._live_entry(key)
+        if entry:
+            self.hits += 1
+            return entry.answer
+        if self.near_duplicates:
+            signature = _minhash(_shingles(key[2]))
+            content = content_words(key[2])
+            for candidate in self._candidates(key, signature):
+                entry = self._live_entry(candidate)
+                if entry and entry.content == content and _similarity(signature, entry.signature) >= self.similarity:
+                    self.near_hits += 1
+                    return entry.answer
+        self.misses += 1
+        return None
+
+    def put(self, question: str, grade: Optional[str], scope: Optional[str], answer: str) -> None:
+        key = self._key(question, grade, scope)
+        if key in self._entries:
+            self._remove(key)
+        entry = _Entry(answer, time.monotonic() + self.ttl_seconds)
+        if self.near_duplicates:
+            entry.signature, entry.content = _minhash(_shingles(key[2])), content_words(key[2])
+        self._entries[key] = entry
+        signature = entry.signature
+        if signature:
+            for band_key in self._band_keys(key, signature):
+                self._bands.setdefault(band_key, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bands.clear()
+
+    def _key(self, question: str, grade: Optional[str], scope: Optional[str]) -> Tuple[str, str, str]:
+        return ((grade or "").strip().lower(), (scope or "").strip().lower(), normalize_question(question))
+
+    def _live_entry(self, key: Tuple[str, str, str]) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _band_keys(self, key: Tuple[str, str, str], signature: Tuple[int, ...]):
+        for band in range(BANDS):
+            yield (key[0], key[1], band, signature[band * _ROWS:(band + 1) * _ROWS])
+
+    def _candidates(self, key: Tuple[str, str, str], signature: Tuple[int, ...]) -> Set[Tuple[str, str, str]]:
+        candidates: Set[Tuple[str, str, str]] = set()
+        for band_key in self._band_keys(key, signature):
+            candidates |= self._bands.get(band_key, set())
+        return candidates
+
+    def _remove(self, key: Tuple[str, str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry and entry.signature:
+            for band_key in self._band_keys(key, entry.signature):
+                bucket = self._bands.get(band_key)
+                if bucket:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._bands[band_key]
@@ -0,0 +1,63 @@
+"""
+In-process harness shared by the benchmarks: boots `server.app` with the fake LLM
+provider and an in-memory MongoDB (mongomock-motor), or a real local MongoDB when
+`mongo_url` is given, and hands back an httpx client wired straight to the ASGI app.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+def configure_env(llm_latency: float, mongo_url: Optional[str] = None, db_name: str = "tutor_benchmark") -> None:
+    """Must run before `server` is imported: it reads its configuration at import time."""
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = str(llm_latency)
+    os.environ["MONGO_URL"] = mongo_url or os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+    os.environ["DB_NAME"] = db_name
+    # The simulated clients share a few student ids and would mostly measure 429s
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+
+def use_database(server, mongo_url: Optional[str], db_name: str):
+    if mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        database = AsyncIOMotorClient(mongo_url)[db_name]
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        database = AsyncMongoMockClient()[db_name]
+    # Every subsystem holds the same lazy handle, so this reaches all of them
+    server.db.use(database)
+    return database
+
+
+@asynccontextmanager
+async def running_app(llm_latency: float = 0.0, mongo_url: Optional[str] = None,
+                      db_name: str = "tutor_benchmark") -> AsyncIterator["object"]:
+    """Yield (server module, httpx.AsyncClient) with the app's lifespan running."""
+    import httpx
+
+    configure_env(llm_latency, mongo_url, db_name)
+    import server
+
+    database = use_database(server, mongo_url, db_name)
+    with tempfile.TemporaryDirectory(prefix="tutor-bench-") as upload_dir:
+        server.VIDEO_UPLOADS_DIR = Path(upload_dir)
+        server.video_store.root = Path(upload_dir)
+        async with server.app.router.lifespan_context(server.app):
+            # Indexes and the default modules are set up in the background; workloads need them in place
+            await asyncio.gather(*server.startup_tasks, return_exceptions=True)
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+                try:
+                    yield server, client
+                finally:
+                    if mongo_url:
+                        await database.client.drop_database(db_name)
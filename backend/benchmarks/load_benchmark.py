@@ -0,0 +1,238 @@
+"""
+Offline load and latency benchmark for the FastAPI backend.
+
+Runs `server.app` in-process with a fake LLM (configurable latency) and an in-memory
+MongoDB, drives a concurrent mixed workload through the main routes and reports
+throughput plus p50/p95/p99 latency per route. Results are written as JSON so two
+runs (e.g. two releases) can be compared with --compare.
+
+    cd backend
+    python -m benchmarks.load_benchmark --duration 20 --concurrency 32 --llm-latency 1.5
+    python -m benchmarks.load_benchmark --compare benchmarks/results/<older>.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.harness import BACKEND_DIR, running_app
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Relative weights of each request type in the mixed workload
+DEFAULT_MIX = {
+    "chat": 2,
+    "messages": 4,
+    "progress_update": 2,
+    "progress_list": 3,
+    "modules": 4,
+    "video_frame": 3,
+    "video_chunk": 3,
+}
+
+QUESTIONS = [
+    "What is a fraction?",
+    "How do plants make their food?",
+    "Why is the sky blue?",
+    "How do I add fractions with different denominators?",
+    "What is the difference between a noun and a verb?",
+]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    values = sorted(latencies)
+    return {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+
+class Workload:
+    def __init__(self, client, students: List[str], modules: List[Dict[str, Any]], video_chunk_kb: int,
+                 unique_questions: bool):
+        self.client = client
+        self.students = students
+        self.module_list = modules
+        self.video_bytes = os.urandom(video_chunk_kb * 1024)
+        self.video_data_url = "data:video/webm;base64," + base64.b64encode(self.video_bytes).decode()
+        self.unique_questions = unique_questions
+        self.counter = 0
+
+    async def chat(self):
+        self.counter += 1
+        question = random.choice(QUESTIONS)
+        if self.unique_questions:
+            question = f"{question} (question {self.counter})"
+        return await self.client.post("/api/chat", json={"student_id": random.choice(self.students), "message": question})
+
+    async def messages(self):
+        return await self.client.get(f"/api/messages/{random.choice(self.students)}")
+
+    async def progress_update(self):
+        module = random.choice(self.module_list)
+        return await self.client.post("/api/progress", json={
+            "student_id": random.choice(self.students),
+            "module_id": module["id"],
+            "module_name": module["name"],
+            "completed": random.random() < 0.5,
+            "score": round(random.uniform(40, 100), 1),
+        })
+
+    async def progress_list(self):
+        return await self.client.get(f"/api/progress/{random.choice(self.students)}")
+
+    async def modules(self):
+        return await self.client.get("/api/modules")
+
+    async def video_frame(self):
+        return await self.client.post("/api/process-video-frame", json={
+            "student_id": random.choice(self.students),
+            "frame_data": self.video_data_url,
+            "mime_type": "video/webm",
+        })
+
+    async def video_chunk(self):
+        return await self.client.post(
+            "/api/video/chunks", params={"student_id": random.choice(self.students)},
+            content=self.video_bytes, headers={"Content-Type": "video/webm"},
+        )
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    mix = {name: weight for name, weight in DEFAULT_MIX.items() if name not in args.skip}
+    names, weights = list(mix), list(mix.values())
+    latencies: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, int] = {name: 0 for name in names}
+
+    async with running_app(llm_latency=args.llm_latency, mongo_url=args.mongo_url) as (server, client):
+        students = []
+        for i in range(args.students):
+            response = await client.post("/api/students", json={"name": f"Student {i}", "grade": str(3 + i % 4)})
+            students.append(response.json()["id"])
+        modules = (await client.get("/api/modules")).json()
+        workload = Workload(client, students, modules, args.video_chunk_kb, args.unique_questions)
+
+        deadline = time.perf_counter() + args.duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                name = random.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    response = await getattr(workload, name)()
+                    ok = response.status_code < 400
+                except Exception:
+                    ok = False
+                if ok:
+                    latencies[name].append(time.perf_counter() - started)
+                else:
+                    errors[name] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": "mongodb" if args.mongo_url else "mongomock",
+        },
+        "config": {
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "students": args.students,
+            "llm_latency_s": args.llm_latency,
+            "video_chunk_kb": args.video_chunk_kb,
+            "unique_questions": args.unique_questions,
+            "mix": mix,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "overall": summarize(all_latencies, sum(errors.values()), elapsed),
+        "routes": {name: summarize(latencies[name], errors[name], elapsed) for name in names},
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    header = f"{'route':<16}{'reqs':>8}{'err':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    rows = dict(result["routes"], overall=result["overall"])
+    for name, stats in rows.items():
+        line = (f"{name:<16}{stats['requests']:>8}{stats['errors']:>6}{stats['throughput_rps']:>10}"
+                f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+        old = (baseline or {}).get("routes", {}).get(name) if name != "overall" else (baseline or {}).get("overall")
+        if old:
+            line += (f"   rps {_delta(stats['throughput_rps'], old['throughput_rps'])}"
+                     f"  p95 {_delta(stats['p95_ms'], old['p95_ms'])}")
+        print(line)
+
+
+def _delta(new: float, old: float) -> str:
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run the workload")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent simulated clients")
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="fake model latency in seconds")
+    parser.add_argument("--video-chunk-kb", type=int, default=64)
+    parser.add_argument("--unique-questions", action="store_true", help="make every chat message distinct")
+    parser.add_argument("--skip", nargs="*", default=[], choices=list(DEFAULT_MIX), help="request types to leave out")
+    parser.add_argument("--mongo-url", default=None, help="use this MongoDB instead of the in-memory stand-in")
+    parser.add_argument("--output", type=Path, default=None, help="where to write the JSON results")
+    parser.add_argument("--compare", type=Path, default=None, help="earlier results file to compare against")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    result = asyncio.run(run_benchmark(args))
+
+    output = args.output or RESULTS_DIR / f"load-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_report(result, baseline)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Per-row cost of turning MongoDB documents into a list endpoint's JSON body.
+
+Compares, for the rows of `GET /api/messages` and `GET /api/progress` at several page
+sizes, the old path (a pydantic model per document, then FastAPI's `response_model`
+validation and serialization, then the stdlib encoder) with the two paths of
+`fast_json.RowEncoder`: one validation pass encoded by pydantic (taken for pages with
+legacy rows, or without orjson) and trusted rows encoded by orjson. No server, database
+or network is involved, so only the CPU spent on serialization is measured.
+
+    cd backend
+    python -m benchmarks.serialization_benchmark
+    python -m benchmarks.serialization_benchmark --compare benchmarks/results/<older>.json
+"""
+import argparse
+import json
+import platform
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.harness import configure_env
+from benchmarks.load_benchmark import RESULTS_DIR, _delta, _git_commit
+
+PAGE_SIZES = [1, 10, 100]
+
+
+def _message_rows(count: int) -> List[Dict[str, Any]]:
+    started = datetime(2026, 1, 1)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "student_id": "student-1",
+            "content": "Plants make their food from sunlight, water and air. " * 4,
+            "role": "tutor" if i % 2 else "student",
+            "timestamp": started + timedelta(seconds=i, milliseconds=i % 1000),
+        }
+        for i in range(count)
+    ]
+
+
+def _progress_rows(count: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "student_id": "student-1",
+            "module_id": str(uuid.uuid4()),
+            "module_name": f"Module {i}",
+            "completed": i % 2 == 0,
+            "score": None if i % 3 else 0.8,
+            "timestamp": datetime(2026, 1, 1) + timedelta(minutes=i),
+        }
+        for i in range(count)
+    ]
+
+
+def _paths(model) -> Dict[str, Callable[[List[Dict[str, Any]]], bytes]]:
+    from fastapi.utils import create_response_field
+    from pydantic import TypeAdapter
+
+    from fast_json import RowEncoder
+
+    field = create_response_field(name="response", type_=List[model])
+    adapter = TypeAdapter(List[model])
+    encoder = RowEncoder(model)
+
+    def response_model(rows):
+        # What the endpoints did before: build models, then FastAPI validates and serializes them again
+        value, _ = field.validate([model(**row) for row in rows], {}, loc=("response",))
+        content = field.serialize(value, by_alias=True)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+    return {
+        "response_model": response_model,
+        "validated": lambda rows: adapter.dump_json(adapter.validate_python(rows)),
+        "trusted": encoder.encode,
+    }
+
+
+def _per_row_us(encode: Callable, rows: List[Dict[str, Any]], min_seconds: float) -> float:
+    encode(rows)
+    iterations, elapsed = 0, 0.0
+    started = time.perf_counter()
+    while elapsed < min_seconds:
+        for _ in range(10):
+            encode(rows)
+        iterations += 10
+        elapsed = time.perf_counter() - started
+    return round(elapsed / iterations / len(rows) * 1e6, 3)
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    configure_env(0.0)
+    from server import Message, ProgressRecord
+
+    endpoints = {"messages": (Message, _message_rows), "progress": (ProgressRecord, _progress_rows)}
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for endpoint, (model, make_rows) in endpoints.items():
+        paths = _paths(model)
+        for size in args.page_sizes:
+            rows = make_rows(size)
+            outputs = {name: json.loads(encode(rows)) for name, encode in paths.items()}
+            if len({json.dumps(output, sort_keys=True) for output in outputs.values()}) != 1:
+                raise RuntimeError(f"{endpoint}: the encoders disagree for {size} rows")
+            results.setdefault(endpoint, {})[str(size)] = {
+                name: _per_row_us(encode, rows, args.min_seconds) for name, encode in paths.items()
+            }
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "config": {"page_sizes": args.page_sizes, "min_seconds": args.min_seconds},
+        "per_row_us": results,
+    }
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    header = f"{'endpoint':<10}{'rows':>6}{'path':>16}{'us/row':>10}{'speedup':>10}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, sizes in result["per_row_us"].items():
+        for size, paths in sizes.items():
+            for name, cost in paths.items():
+                line = f"{endpoint:<10}{size:>6}{name:>16}{cost:>10}{paths['response_model'] / cost:>9.1f}x"
+                old = (baseline or {}).get("per_row_us", {}).get(endpoint, {}).get(size, {}).get(name)
+                if old:
+                    line += f"   {_delta(cost, old)}"
+                print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=PAGE_SIZES, help="rows per response")
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="time spent measuring each case")
+    parser.add_argument("--output", type=Path, default=None, help="where to write the JSON results")
+    parser.add_argument("--compare", type=Path, default=None, help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    output = args.output or RESULTS_DIR / f"serialization-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_report(result, baseline)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Cold-start benchmark: how long a fresh backend process takes to import `server`, run
+its startup, answer its first requests and report ready.
+
+Every run is a new Python process (nothing is warm in sys.modules), against the
+in-memory MongoDB stand-in unless --mongo-url is given. With --provider gemini the
+real SDK is set up (with a dummy key unless GOOGLE_AI_API_KEY is set; nothing is sent
+to Google), which is what production pays. Results are written as JSON and can be
+compared with an earlier run like the load benchmark's.
+
+    cd backend
+    python -m benchmarks.startup_benchmark --runs 5
+    python -m benchmarks.startup_benchmark --provider gemini --importtime
+    python -m benchmarks.startup_benchmark --compare benchmarks/results/<older>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.harness import BACKEND_DIR, configure_env, use_database
+from benchmarks.load_benchmark import RESULTS_DIR, _delta, _git_commit
+
+PHASES = ["process_start_ms", "import_ms", "startup_ms", "first_request_ms", "first_api_ms", "ready_ms"]
+
+
+async def _first_requests(server, started_at: float) -> Dict[str, float]:
+    import httpx
+
+    def since(mark: float) -> float:
+        return round((time.perf_counter() - mark) * 1000, 2)
+
+    timings = {}
+    mark = time.perf_counter()
+    async with server.app.router.lifespan_context(server.app):
+        timings["startup_ms"] = since(mark)
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+            mark = time.perf_counter()
+            (await client.get("/healthz")).raise_for_status()
+            timings["first_request_ms"] = since(mark)
+            mark = time.perf_counter()
+            (await client.get("/api/modules")).raise_for_status()
+            timings["first_api_ms"] = since(mark)
+            # Counted from the end of the import: what an orchestrator waits before routing traffic here
+            while (await client.get("/readyz")).status_code != 200:
+                if time.perf_counter() - started_at > 60:
+                    raise RuntimeError("Not ready after 60 seconds")
+                await asyncio.sleep(0.01)
+            timings["ready_ms"] = since(started_at)
+    return timings
+
+
+def child(args) -> None:
+    """One measurement, in this fresh process; prints a JSON line for the parent."""
+    process_start = time.time()
+    configure_env(0.0, args.mongo_url)
+    if args.provider == "gemini":
+        os.environ["LLM_PROVIDER"] = "gemini"
+        os.environ.setdefault("GOOGLE_AI_API_KEY", "startup-benchmark")
+    mark = time.perf_counter()
+    import server
+    timings = {"import_ms": round((time.perf_counter() - mark) * 1000, 2)}
+    imported_at = time.perf_counter()
+    use_database(server, args.mongo_url, "tutor_startup_benchmark")
+    timings.update(asyncio.run(_first_requests(server, imported_at)))
+    timings["process_start_ms"] = round((process_start - args.spawned_at) * 1000, 2)
+    print(json.dumps(timings))
+
+
+def _run_child(args, importtime: bool = False) -> subprocess.CompletedProcess:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + [
+        "-m", "benchmarks.startup_benchmark", "--child", "--provider", args.provider,
+        "--spawned-at", repr(time.time()),
+    ]
+    if args.mongo_url:
+        command += ["--mongo-url", args.mongo_url]
+    completed = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Startup run failed:\n{completed.stderr[-2000:]}")
+    return completed
+
+
+def slowest_imports(importtime_log: str, count: int = 10) -> List[Dict[str, Any]]:
+    """Top-level imports by cumulative time, from `python -X importtime` output."""
+    imports = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  ", 1):
+            imports.append({"module": name.strip(), "cumulative_ms": round(int(cumulative) / 1000, 1)})
+    return sorted(imports, key=lambda item: -item["cumulative_ms"])[:count]
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    runs = [json.loads(_run_child(args).stdout.strip().splitlines()[-1]) for _ in range(args.runs)]
+    result = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": "mongodb" if args.mongo_url else "mongomock",
+        },
+        "config": {"runs": args.runs, "provider": args.provider},
+        "phases": {
+            phase: {
+                "median_ms": round(statistics.median(run[phase] for run in runs), 2),
+                "min_ms": min(run[phase] for run in runs),
+                "max_ms": max(run[phase] for run in runs),
+            }
+            for phase in PHASES
+        },
+        "runs": runs,
+    }
+    if args.importtime:
+        result["slowest_imports"] = slowest_imports(_run_child(args, importtime=True).stderr)
+    return result
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    header = f"{'phase':<20}{'median ms':>12}{'min ms':>10}{'max ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for phase, stats in result["phases"].items():
+        line = f"{phase:<20}{stats['median_ms']:>12}{stats['min_ms']:>10}{stats['max_ms']:>10}"
+        old = (baseline or {}).get("phases", {}).get(phase)
+        if old:
+            line += f"   median {_delta(stats['median_ms'], old['median_ms'])}"
+        print(line)
+    if result.get("slowest_imports"):
+        print("\nslowest top-level imports")
+        for item in result["slowest_imports"]:
+            print(f"  {item['module']:<40}{item['cumulative_ms']:>10} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to measure")
+    parser.add_argument("--provider", choices=["fake", "gemini"], default="fake", help="LLM provider to set up")
+    parser.add_argument("--importtime", action="store_true", help="also list the slowest imports")
+    parser.add_argument("--mongo-url", default=None, help="use this MongoDB instead of the in-memory stand-in")
+    parser.add_argument("--output", type=Path, default=None, help="where to write the JSON results")
+    parser.add_argument("--compare", type=Path, default=None, help="earlier results file to compare against")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--spawned-at", type=float, default=0.0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+    result = run_benchmark(args)
+    output = args.output or RESULTS_DIR / f"startup-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_report(result, baseline)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
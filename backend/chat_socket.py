@@ -0,0 +1,62 @@
+import asyncio
+import json
+from typing import Any, Dict
+
+from fastapi import WebSocket
+
+
+class SlowClientError(Exception):
+    """The client did not take an event within the send timeout."""
+
+
+class EventSender:
+    """
+    Sends JSON events on one WebSocket, one at a time.
+
+    A send only completes once the server has handed the frame to the transport, so
+    a client that reads slowly holds up whoever is producing events (the tutor's
+    token stream) instead of letting them pile up in memory. A client that stops
+    reading altogether makes the send fail with SlowClientError after
+    `send_timeout` seconds.
+    """
+
+    def __init__(self, websocket: WebSocket, send_timeout: float = 30.0):
+        self.websocket = websocket
+        self.send_timeout = send_timeout
+        self._lock = asyncio.Lock()
+
+    async def send(self, event: Dict[str, Any]) -> None:
+        text = json.dumps(event)
+        async with self._lock:
+            try:
+                await asyncio.wait_for(self.websocket.send_text(text), self.send_timeout)
+            except asyncio.TimeoutError:
+                raise SlowClientError(f"Client took no event for {self.send_timeout:g}s")
+
+
+class TurnQueue:
+    """
+    Chat messages sent on one connection, answered one at a time. At most
+    `max_waiting` may wait behind the one being answered; `full` tells the reader
+    to refuse more instead of queueing without bound.
+    """
+
+    def __init__(self, max_waiting: int = 2):
+        self.max_waiting = max_waiting
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.outstanding = 0  # waiting plus being answered
+
+    @property
+    def full(self) -> bool:
+        return self.outstanding > self.max_waiting
+
+    def put(self, item: Any) -> None:
+        self.outstanding += 1
+        self._queue.put_nowait(item)
+
+    async def get(self) -> Any:
+        return await self._queue.get()
+
+    def done(self) -> None:
+        """The turn taken with `get` is answered."""
+        self.outstanding -= 1
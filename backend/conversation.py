@@ -0,0 +1,157 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Rough heuristic for Gemini tokens; good enough to keep prompts inside a budget
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+@dataclass
+class ConversationWindow:
+    summary: Optional[str] = None
+    turns: List[Dict[str, Any]] = field(default_factory=list)  # oldest first
+    overflow: List[Dict[str, Any]] = field(default_factory=list)  # older turns not yet summarized, oldest first
+
+    def to_gemini_history(self) -> List[Dict[str, Any]]:
+        """Convert to Gemini chat history, merging consecutive turns from the same side."""
+        history: List[Dict[str, Any]] = []
+        if self.summary:
+            history.append({"role": "user", "parts": [f"Summary of our conversation so far: {self.summary}"]})
+            history.append({"role": "model", "parts": ["Thanks, I'll keep that in mind."]})
+        for turn in self.turns:
+            role = "user" if turn["role"] == "student" else "model"
+            if history and history[-1]["role"] == role:
+                history[-1]["parts"].append(turn["content"])
+            else:
+                history.append({"role": role, "parts": [turn["content"]]})
+        return history
+
+
+class ConversationMemory:
+    """
+    Server-side chat history for the tutor.
+
+    Each turn loads only the most recent messages that fit in `token_budget`.
+    Older messages are folded into a rolling per-student summary stored in
+    `db.conversation_summaries`; the fold runs in the background so it never
+    adds latency to the reply. A window can also be kept for a whole session
+    and grown with `extend()` instead of being loaded again for every turn.
+
+    Once the history passes the budget it is cut back to `fold_to` of it (half by
+    default), so a fold summarizes a batch of turns and the next several turns fit
+    without another summarization call.
+    """
+
+    def __init__(
+        self,
+        db,
+        summarize: Callable[[Optional[str], List[Dict[str, Any]]], Awaitable[str]],
+        token_budget: int = 2000,
+        max_turns: int = 100,
+        fold_to: float = 0.5,
+        pending: Optional[Callable[[str], List[Dict[str, Any]]]] = None,
+    ):
+        self.db = db
+        # Messages accepted but not yet stored (see MessageWriteBuffer), so the window never misses them
+        self.pending = pending
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.fold_tokens = int(token_budget * fold_to)
+        self.fold_turns = max(1, int(max_turns * fold_to))
+        self._folding: Dict[str, asyncio.Task] = {}
+
+    async def load(self, student_id: str) -> ConversationWindow:
+        summary_doc = await self.db.conversation_summaries.find_one(
+            {"student_id": student_id}, {"_id": 0, "summary": 1, "summarized_until": 1}
+        )
+        query: Dict[str, Any] = {"student_id": student_id}
+        if summary_doc and summary_doc.get("summarized_until"):
+            query["timestamp"] = {"$gt": summary_doc["summarized_until"]}
+
+        recent = await self.db.messages.find(
+            query, {"_id": 0, "id": 1, "role": 1, "content": 1, "timestamp": 1}
+        ).sort("timestamp", -1).to_list(self.max_turns)
+        if self.pending is not None:
+            stored = {turn["id"] for turn in recent}
+            since = query.get("timestamp", {}).get("$gt")
+            buffered = [turn for turn in self.pending(student_id)
+                        if turn["id"] not in stored and (since is None or turn["timestamp"] > since)]
+            if buffered:
+                recent = sorted(recent + buffered, key=lambda turn: turn["timestamp"], reverse=True)[:self.max_turns]
+
+        window = ConversationWindow(
+            summary=summary_doc.get("summary") if summary_doc else None,
+            turns=list(reversed(recent)),
+        )
+        self._trim(window)
+        return window
+
+    def extend(self, window: ConversationWindow, turns: List[Dict[str, Any]]) -> None:
+        """Add new turns to a window kept across turns, moving the oldest to its overflow once past the budget."""
+        window.turns.extend(turns)
+        self._trim(window)
+
+    def _trim(self, window: ConversationWindow) -> None:
+        used = sum(estimate_tokens(turn["content"]) for turn in window.turns)
+        if window.summary:
+            used += estimate_tokens(window.summary)
+        if used > self.token_budget or len(window.turns) > self.max_turns:
+            while len(window.turns) > 1 and (used > self.fold_tokens or len(window.turns) > self.fold_turns):
+                turn = window.turns.pop(0)
+                used -= estimate_tokens(turn["content"])
+                window.overflow.append(turn)
+        self._open_with_student(window)
+
+    @staticmethod
+    def _open_with_student(window: ConversationWindow) -> None:
+        # Gemini history has to open with a user turn; older tutor turns go to the summary instead
+        while window.overflow and window.turns and window.turns[0]["role"] != "student":
+            window.overflow.append(window.turns.pop(0))
+
+    def schedule_fold(self, student_id: str, window: ConversationWindow) -> None:
+        """Fold the window's overflow into the stored summary, at most one fold per student at a time."""
+        if not window.overflow or student_id in self._folding:
+            return
+        task = asyncio.create_task(self._fold(student_id, window, window.summary, list(window.overflow)))
+        self._folding[student_id] = task
+        task.add_done_callback(lambda _: self._folding.pop(student_id, None))
+
+    async def _fold(self, student_id: str, window: ConversationWindow, summary: Optional[str],
+                    overflow: List[Dict[str, Any]]) -> None:
+        try:
+            new_summary = await self.summarize(summary, overflow)
+            # A window still in use (see extend) carries on from the new summary
+            window.summary = new_summary
+            del window.overflow[:len(overflow)]
+            until = overflow[-1]["timestamp"]
+            # Another worker process may have folded further meanwhile; never move the summary back
+            await self.db.conversation_summaries.update_one(
+                {"student_id": student_id, "summarized_until": {"$not": {"$gte": until}}},
+                {"$set": {
+                    "summary": new_summary,
+                    "summarized_until": until,
+                    "updated_at": datetime.utcnow(),
+                }},
+                upsert=True,
+            )
+            logger.info(f"Folded {len(overflow)} messages into the summary for student {student_id}")
+        except DuplicateKeyError:
+            # The upsert lost to that newer summary (unique index on student_id); keep it
+            logger.info(f"Kept a newer conversation summary for student {student_id}")
+        except Exception as e:
+            logger.warning(f"Could not update conversation summary for student {student_id}: {e}")
+
+    async def wait_for_folds(self) -> None:
+        if self._folding:
+            await asyncio.gather(*self._folding.values(), return_exceptions=True)
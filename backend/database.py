@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LazyDatabase:
+    """
+    MongoDB database handle whose Motor client is created on first use.
+
+    Stands in for a Motor database (`db.students.find_one(...)`), so modules can be
+    handed it at import time while Motor is imported, and the client with its
+    connection pool and monitor threads is created, only when the first query runs
+    inside the event loop. `use()` swaps in another database object, e.g. an
+    in-memory one for benchmarks.
+
+    A client must not be shared across fork(): a child process forgets the parent's
+    client and creates its own on first use.
+    """
+
+    def __init__(self, url: Optional[str], name: Optional[str], **client_options: Any):
+        self.url = url
+        self.name = name
+        self.client_options: Dict[str, Any] = client_options
+        self._client = None
+        self._database = None
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._forget_client)
+
+    def _forget_client(self) -> None:
+        if self._client is not None:
+            # Its sockets and monitor threads belong to the parent; closing them here would disturb it
+            self._client = None
+            self._database = None
+
+    @property
+    def connected(self) -> bool:
+        return self._database is not None
+
+    @property
+    def client(self):
+        if self._client is None:
+            if not self.url or not self.name:
+                raise RuntimeError("MONGO_URL and DB_NAME must be set")
+            from motor.motor_asyncio import AsyncIOMotorClient
+            self._client = AsyncIOMotorClient(self.url, **self.client_options)
+            logger.info("MongoDB client created")
+        return self._client
+
+    @property
+    def database(self):
+        if self._database is None:
+            self._database = self.client[self.name]
+        return self._database
+
+    def use(self, database) -> None:
+        """Serve every query from `database` instead of the configured client."""
+        self._database = database
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.database, name)
+
+    def __getitem__(self, name: str):
+        return self.database[name]
+
+    async def ping(self, timeout: float = 2.0) -> None:
+        await asyncio.wait_for(self.database.command("ping"), timeout)
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            logger.info("MongoDB client closed")
+            self._client = None
+            self._database = None
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def client_options_from_env() -> Dict[str, Any]:
+    """
+    Motor client settings from MONGO_* variables. The pool is per process, so with
+    several workers MongoDB sees up to workers x MONGO_MAX_POOL_SIZE connections.
+    Unset timeouts keep the driver defaults, except server selection, which fails
+    after 5 seconds instead of 30 so /readyz and requests give up quickly.
+    """
+    options: Dict[str, Any] = {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 50)),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+    }
+    for option, variable in (
+        ("maxIdleTimeMS", "MONGO_MAX_IDLE_TIME_MS"),
+        ("connectTimeoutMS", "MONGO_CONNECT_TIMEOUT_MS"),
+        ("socketTimeoutMS", "MONGO_SOCKET_TIMEOUT_MS"),
+        ("waitQueueTimeoutMS", "MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+    ):
+        value = _env_int(variable)
+        if value is not None:
+            options[option] = value
+    compressors = os.getenv("MONGO_COMPRESSORS")  # e.g. "zstd,zlib"; zstd needs the zstandard package
+    if compressors:
+        options["compressors"] = compressors
+    return options
@@ -0,0 +1,183 @@
+"""
+MongoDB index bootstrap and query-plan checks.
+
+`ensure_indexes` is idempotent and runs from the app's lifespan hook. With
+QUERY_PLAN_CHECK=true the lifespan also runs `check_query_plans`, which explains
+each hot query used by the routes and warns about collection scans. The checks can
+also be run by hand against the configured database:
+
+    cd backend
+    python db_indexes.py
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "students": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "messages": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Serves keyset pagination on (timestamp, id) and the newest-first history window
+        IndexModel(
+            [("student_id", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)], name="student_timeline"
+        ),
+    ],
+    "progress": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("student_id", ASCENDING), ("module_id", ASCENDING)], name="student_module_unique", unique=True),
+    ],
+    "modules": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Default modules are seeded by upserting on name
+        IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+    ],
+    "video_chunks": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("student_id", ASCENDING), ("timestamp", ASCENDING)], name="student_timestamp"),
+    ],
+    "video_sessions": [
+        IndexModel([("student_id", ASCENDING), ("session_id", ASCENDING)], name="student_session_unique", unique=True),
+        IndexModel([("session_id", ASCENDING)], name="session_id"),
+        # Compaction: idle sessions to finalize, and sessions past retention
+        IndexModel([("status", ASCENDING), ("updated_at", ASCENDING)], name="status_updated"),
+        IndexModel([("created_at", ASCENDING)], name="created_at"),
+    ],
+    "engagement_samples": [
+        IndexModel([("student_id", ASCENDING), ("recorded_at", ASCENDING)], name="student_recorded"),
+        IndexModel([("session_id", ASCENDING), ("seq", ASCENDING)], name="session_seq"),
+    ],
+    "conversation_summaries": [
+        IndexModel([("student_id", ASCENDING)], name="student_unique", unique=True),
+    ],
+}
+
+
+class HotQuery(NamedTuple):
+    route: str
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[List[Tuple[str, int]]] = None
+
+
+# Representative shapes of the queries each route issues; values are placeholders
+HOT_QUERIES: List[HotQuery] = [
+    HotQuery("GET /api/students/{id}", "students", {"id": "x"}),
+    HotQuery("POST /api/chat (student)", "students", {"id": "x"}),
+    HotQuery("GET /api/messages/{id}", "messages", {"student_id": "x"}, [("timestamp", DESCENDING), ("id", DESCENDING)]),
+    HotQuery("POST /api/chat (history)", "messages", {"student_id": "x"}, [("timestamp", DESCENDING)]),
+    HotQuery("POST /api/chat (summary)", "conversation_summaries", {"student_id": "x"}),
+    HotQuery("POST /api/progress", "progress", {"student_id": "x", "module_id": "y"}),
+    HotQuery("POST /api/progress (by id)", "progress", {"id": "x"}),
+    HotQuery("GET /api/progress/{id}", "progress", {"student_id": "x"}),
+    HotQuery("POST /api/video/chunks", "video_sessions", {"student_id": "x", "session_id": "y"}),
+    HotQuery("POST /api/video/sessions/{id}/chunks", "video_sessions", {"student_id": "x", "session_id": "y"}),
+    HotQuery("POST /api/video/chunks (no session)", "video_sessions",
+             {"student_id": "x", "implicit": True, "status": "recording"}, [("created_at", DESCENDING)]),
+]
+
+
+class IndexBuildError(RuntimeError):
+    """A unique index could not be built, e.g. because duplicate keys are already stored."""
+
+
+async def _duplicate_keys(db, collection: str, index: IndexModel, limit: int = 3) -> List[Dict[str, Any]]:
+    """Up to `limit` key values that more than one document in `collection` shares, for the error message."""
+    pipeline = [
+        {"$group": {"_id": {field: f"${field}" for field in index.document["key"]}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": limit},
+    ]
+    try:
+        return [row["_id"] async for row in db[collection].aggregate(pipeline)]
+    except OperationFailure:
+        return []
+
+
+async def ensure_indexes(db) -> None:
+    """
+    Create every index in INDEXES. Existing identical indexes are a no-op and other
+    conflicts are logged, but a unique index that cannot be built raises
+    IndexBuildError once the rest have been tried: the routes rely on those
+    constraints, so the duplicates have to be removed before the app can serve.
+    """
+    unbuilt: List[str] = []
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                await db[collection].create_indexes([index])
+            except OperationFailure as e:
+                # e.g. duplicate keys already stored, or an index of the same name with other options
+                logger.error(f"Could not create index {name} on {collection}: {e}")
+                if index.document.get("unique"):
+                    duplicates = await _duplicate_keys(db, collection, index)
+                    reason = f"duplicate keys, e.g. {duplicates}" if duplicates else str(e)
+                    unbuilt.append(f"{collection}.{name} ({reason})")
+    if unbuilt:
+        raise IndexBuildError(
+            f"Unique indexes could not be built: {'; '.join(unbuilt)}. "
+            "Remove the duplicate documents, then restart the app."
+        )
+    logger.info(f"MongoDB indexes ensured on {len(INDEXES)} collections")
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan["stage"]] if plan.get("stage") else []
+    for key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(key), dict):
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+async def explain_query(db, query: HotQuery) -> List[str]:
+    cursor = db[query.collection].find(query.filter)
+    if query.sort:
+        cursor = cursor.sort(query.sort)
+    explanation = await cursor.limit(1).explain()
+    return _plan_stages(explanation.get("queryPlanner", {}).get("winningPlan", {}))
+
+
+async def check_query_plans(db) -> Dict[str, List[str]]:
+    """Explain every hot query and warn about COLLSCAN or in-memory SORT stages. Returns route -> stages."""
+    report: Dict[str, List[str]] = {}
+    for query in HOT_QUERIES:
+        try:
+            stages = await explain_query(db, query)
+        except Exception as e:
+            logger.warning(f"Could not explain query for {query.route}: {e}")
+            continue
+        report[query.route] = stages
+        if "COLLSCAN" in stages:
+            logger.warning(f"Query plan check: {query.route} does a COLLSCAN on {query.collection} ({stages})")
+        elif "SORT" in stages:
+            logger.warning(f"Query plan check: {query.route} sorts {query.collection} in memory ({stages})")
+    logger.info(f"Query plan check finished for {len(report)} queries")
+    return report
+
+
+if __name__ == "__main__":
+    import os
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def main():
+        database = AsyncIOMotorClient(os.environ['MONGO_URL'])[os.environ['DB_NAME']]
+        await ensure_indexes(database)
+        for route, stages in (await check_query_plans(database)).items():
+            print(f"{route:<40} {' <- '.join(stages)}")
+
+    asyncio.run(main())
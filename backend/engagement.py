@@ -0,0 +1,259 @@
+"""
+Background engagement analysis of recorded video.
+
+Every stored chunk can be submitted to `EngagementPipeline`, which keeps the work off
+the request path: jobs go into a bounded queue (new jobs are dropped when it is full,
+so uploads never wait on analysis), a process pool decodes the chunk and samples
+every Nth frame, and results are written to `db.engagement_samples` in batches.
+
+The analysis itself (`analyze_chunk`) runs in worker processes and needs OpenCV;
+without it the pipeline logs a warning and stays off.
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from typing import Any, Dict, List, Optional, Tuple
+
+from video_store import SegmentEntry, SegmentStore
+
+logger = logging.getLogger(__name__)
+
+# WebM (Matroska) Cluster element id; everything before the first one is the stream header
+_CLUSTER_ID = b"\x1f\x43\xb6\x75"
+# Frames are scaled down to this width before measuring; the signals don't need more
+_ANALYSIS_WIDTH = 160
+
+_face_detector = None
+
+
+def _read_range(fd: int, offset: int, length: int) -> bytes:
+    return os.pread(fd, length, offset)
+
+
+def _stream_header(first_chunk: bytes) -> bytes:
+    position = first_chunk.find(_CLUSTER_ID)
+    return first_chunk[:position] if position > 0 else b""
+
+
+def analyze_chunk(data_path: str, header: Optional[Tuple[int, int]], chunk: Tuple[int, int],
+                  sample_every: int) -> Optional[Dict[str, Any]]:
+    """
+    Decode one chunk of a session file and measure every `sample_every`-th frame.
+
+    `header` and `chunk` are (offset, length) ranges in the session file; `header` is
+    the session's first chunk, whose stream header makes later chunks decodable on
+    their own. Returns averaged signals, or None if no frame could be decoded.
+    Runs in a worker process.
+    """
+    import cv2
+    import numpy as np
+
+    global _face_detector
+    if _face_detector is None:
+        _face_detector = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml"))
+
+    fd = os.open(data_path, os.O_RDONLY)
+    try:
+        data = _read_range(fd, *chunk)
+        if header is not None:
+            data = _stream_header(_read_range(fd, *header)) + data
+    finally:
+        os.close(fd)
+
+    with tempfile.NamedTemporaryFile(suffix=".webm") as tmp:
+        tmp.write(data)
+        tmp.flush()
+        capture = cv2.VideoCapture(tmp.name)
+        frames, samples = 0, []
+        try:
+            while capture.grab():
+                frames += 1
+                if (frames - 1) % sample_every:
+                    continue
+                ok, frame = capture.retrieve()
+                if not ok:
+                    continue
+                height, width = frame.shape[:2]
+                scale = _ANALYSIS_WIDTH / width
+                small = cv2.resize(frame, (_ANALYSIS_WIDTH, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+                samples.append(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY))
+        finally:
+            capture.release()
+
+    if not samples:
+        return None
+    stack = np.stack(samples).astype(np.float32)
+    brightness = float(stack.mean() / 255)
+    # Mean absolute change between consecutive samples, 0..1
+    motion = float(np.abs(np.diff(stack, axis=0)).mean() / 255) if len(samples) > 1 else 0.0
+    faces = sum(
+        1 for gray in samples
+        if len(_face_detector.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=4, minSize=(20, 20)))
+    )
+    return {
+        "frames": frames,
+        "samples": len(samples),
+        "face_ratio": faces / len(samples),
+        "motion": motion,
+        "brightness": brightness,
+    }
+
+
+def opencv_available() -> bool:
+    # Only the worker processes import OpenCV; the server process just checks it is there
+    return importlib.util.find_spec("cv2") is not None
+
+
+class EngagementPipeline:
+    """
+    Bounded, load-shedding queue in front of a process pool of `analyze_chunk` workers.
+
+    `submit` never blocks: when `queue_size` jobs are already waiting the new job is
+    dropped and counted in `stats["shed"]`. Results are buffered and written with one
+    `insert_many` per `batch_size` results or every `flush_interval` seconds.
+    """
+
+    def __init__(self, db, store: SegmentStore, workers: int = 2, queue_size: int = 100, sample_every: int = 10,
+                 batch_size: int = 50, flush_interval: float = 5.0):
+        self.db = db
+        self.store = store
+        self.workers = workers
+        self.sample_every = sample_every
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "asyncio.Queue[Tuple[str, str, SegmentEntry]]" = asyncio.Queue(maxsize=queue_size)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+        self._results: List[Dict[str, Any]] = []
+        self._header_entries: Dict[Tuple[str, str], SegmentEntry] = {}
+        self.submitted = 0
+        self.shed = 0
+        self.analyzed = 0
+        self.failed = 0
+        self.written = 0
+
+    @property
+    def running(self) -> bool:
+        return self._pool is not None
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "submitted": self.submitted,
+            "shed": self.shed,
+            "analyzed": self.analyzed,
+            "failed": self.failed,
+            "written": self.written,
+            "unwritten": len(self._results),
+        }
+
+    def start(self) -> None:
+        if not opencv_available():
+            logger.warning("Engagement analysis is enabled but OpenCV is not installed; it stays off")
+            return
+        # Spawned (not forked) workers: they must not inherit the event loop, Mongo client or LLM threads
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"))
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._flush_periodically()))
+        logger.info(f"Engagement analysis started with {self.workers} workers")
+
+    def submit(self, student_id: str, session_id: str, entry: SegmentEntry) -> bool:
+        """Queue a stored chunk for analysis. Returns False if it was shed."""
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait((student_id, session_id, entry))
+        except asyncio.QueueFull:
+            self.shed += 1
+            if self.shed % 100 == 1:
+                logger.warning(f"Engagement analysis queue full; shedding work ({self.shed} chunks skipped so far)")
+            return False
+        self.submitted += 1
+        return True
+
+    async def _header_for(self, student_id: str, session_id: str, entry: SegmentEntry) -> Optional[SegmentEntry]:
+        """The session's chunk 0, which carries the WebM header; None for chunk 0 itself or if it isn't stored yet."""
+        if entry.seq == 0:
+            return None
+        key = (student_id, session_id)
+        if key not in self._header_entries:
+            first = next((e for e in await self.store.index(student_id, session_id) if e.seq == 0), None)
+            if first is None:
+                return None
+            self._header_entries[key] = first
+            if len(self._header_entries) > 1000:
+                self._header_entries.pop(next(iter(self._header_entries)))
+        return self._header_entries[key]
+
+    async def _work(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            student_id, session_id, entry = await self._queue.get()
+            try:
+                header = await self._header_for(student_id, session_id, entry)
+                started = time.perf_counter()
+                result = await loop.run_in_executor(
+                    self._pool, analyze_chunk,
+                    str(self.store.paths(student_id, session_id)[0]),
+                    (header.offset, header.length) if header else None,
+                    (entry.offset, entry.length),
+                    self.sample_every,
+                )
+                if result is None:
+                    self.failed += 1
+                    continue
+                self.analyzed += 1
+                self._results.append({
+                    "id": str(uuid.uuid4()),
+                    "student_id": student_id,
+                    "session_id": session_id,
+                    "seq": entry.seq,
+                    "recorded_at": datetime.utcfromtimestamp(entry.received_at_ms / 1000),
+                    "analyzed_at": datetime.utcnow(),
+                    "analysis_ms": round((time.perf_counter() - started) * 1000, 1),
+                    **result,
+                })
+                if len(self._results) >= self.batch_size:
+                    await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # e.g. the raw session file was compacted away before its turn came
+                self.failed += 1
+                logger.warning(f"Engagement analysis failed for session {session_id} chunk {entry.seq}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._results:
+            return
+        batch, self._results = self._results, []
+        try:
+            await self.db.engagement_samples.insert_many(batch, ordered=False)
+            self.written += len(batch)
+        except Exception as e:
+            logger.error(f"Could not write {len(batch)} engagement results: {e}")
+
+    async def stop(self) -> None:
+        """Drop queued work, finish writing what has been analyzed and shut the pool down."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.flush()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
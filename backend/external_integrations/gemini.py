@@ -0,0 +1,88 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional
+
+import google.generativeai as genai
+
+from external_integrations.llm import LLMProvider
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "gemini-1.5-pro-latest"
+DEFAULT_GENERATION_CONFIG = {
+    "temperature": 0.9,
+    "top_p": 1,
+    "top_k": 1,
+    "max_output_tokens": 2048,
+}
+
+
+class GeminiProvider(LLMProvider):
+    """
+    Google Gemini via google-generativeai. Each distinct system instruction (the
+    per-student tutor persona) gets its own GenerativeModel, kept in a small LRU so
+    it is built once and reused across turns.
+    """
+
+    name = "gemini"
+
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = DEFAULT_MODEL_NAME,
+        generation_config: Optional[Dict[str, Any]] = None,
+        request_timeout: Optional[float] = None,
+        model_cache_size: int = 1000,
+    ):
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.generation_config = generation_config or DEFAULT_GENERATION_CONFIG
+        self.request_options = {"timeout": request_timeout} if request_timeout else None
+        self.model_cache_size = model_cache_size
+        self._models: "OrderedDict[Optional[str], genai.GenerativeModel]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "GeminiProvider":
+        api_key = os.getenv("GOOGLE_AI_API_KEY")
+        if not api_key:
+            logger.error("GOOGLE_AI_API_KEY not found in environment variables. Please set it in backend/.env")
+            raise ValueError("GOOGLE_AI_API_KEY not found in environment variables.")
+        return cls(
+            api_key,
+            model_name=os.getenv("GEMINI_MODEL", DEFAULT_MODEL_NAME),
+            request_timeout=float(os.getenv("LLM_DEADLINE", 30)),
+            model_cache_size=int(os.getenv("TUTOR_MODEL_CACHE_SIZE", 1000)),
+        )
+
+    def _model_for(self, system_instruction: Optional[str]) -> genai.GenerativeModel:
+        # Called from LLM pool threads, hence the lock around the LRU
+        with self._lock:
+            cached = self._models.get(system_instruction)
+            if cached is not None:
+                self._models.move_to_end(system_instruction)
+                return cached
+            model = genai.GenerativeModel(
+                model_name=self.model_name,
+                generation_config=self.generation_config,
+                system_instruction=system_instruction,
+            )
+            self._models[system_instruction] = model
+            if len(self._models) > self.model_cache_size:
+                self._models.popitem(last=False)
+            return model
+
+    def generate(self, system_instruction: Optional[str], history: List[Dict[str, Any]], message: str) -> str:
+        chat = self._model_for(system_instruction).start_chat(history=history)
+        return chat.send_message(message, request_options=self.request_options).text
+
+    def stream(self, system_instruction: Optional[str], history: List[Dict[str, Any]], message: str) -> Iterator[str]:
+        chat = self._model_for(system_instruction).start_chat(history=history)
+        for chunk in chat.send_message(message, stream=True, request_options=self.request_options):
+            if chunk.text:
+                yield chunk.text
+
+    def describe(self) -> Dict[str, Any]:
+        return {"provider": self.name, "model": self.model_name}
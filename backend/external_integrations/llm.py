@@ -0,0 +1,477 @@
+import asyncio
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LLMOverloadedError(Exception):
+    """Raised when the LLM queue is full or a caller waited too long for a slot."""
+
+
+class LLMUnavailableError(Exception):
+    """Raised when the provider keeps failing or timing out, or the circuit breaker is open."""
+
+
+class LLMProvider(ABC):
+    """
+    A chat model behind a blocking API. Calls always go through ResilientLLM, which
+    runs them on the LLMExecutor pool and adds deadlines, retries and the breaker.
+    `history` uses Gemini's shape: [{"role": "user" | "model", "parts": [str, ...]}].
+    """
+
+    name = "provider"
+
+    @abstractmethod
+    def generate(self, system_instruction: Optional[str], history: List[Dict[str, Any]], message: str) -> str:
+        ...
+
+    @abstractmethod
+    def stream(self, system_instruction: Optional[str], history: List[Dict[str, Any]], message: str) -> Iterator[str]:
+        ...
+
+    def describe(self) -> Dict[str, Any]:
+        return {"provider": self.name}
+
+    def load(self) -> "LLMProvider":
+        """Return the provider that serves calls, building it first if it is built lazily."""
+        return self
+
+
+class LazyLLMProvider(LLMProvider):
+    """
+    Builds the real provider on first use (or on an explicit `load()`, e.g. a warm-up),
+    so importing the app needs neither the SDK nor its credentials. A failed build is
+    retried on the next call.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], LLMProvider]):
+        self.name = name
+        self._factory = factory
+        self._provider: Optional[LLMProvider] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._provider is not None
+
+    def load(self) -> LLMProvider:
+        if self._provider is None:
+            with self._lock:
+                if self._provider is None:
+                    self._provider = self._factory()
+        return self._provider
+
+    def generate(self, system_instruction, history, message):
+        return self.load().generate(system_instruction, history, message)
+
+    def stream(self, system_instruction, history, message):
+        return self.load().stream(system_instruction, history, message)
+
+    def describe(self):
+        return self._provider.describe() if self._provider else {"provider": self.name, "loaded": False}
+
+
+class FakeLLMProvider(LLMProvider):
+    """
+    Deterministic offline provider for tests and benchmarks. Replies echo the message,
+    take `latency` seconds (spread over `chunks` pieces when streaming) and the first
+    `fail_first` calls raise, so retries and the breaker can be exercised.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.0, chunks: int = 5, fail_first: int = 0):
+        self.latency = latency
+        self.chunks = max(1, chunks)
+        self.fail_first = fail_first
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _begin_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+            failing = self.calls <= self.fail_first
+        if failing:
+            raise RuntimeError("fake provider failure")
+
+    def reply_for(self, history: List[Dict[str, Any]], message: str) -> str:
+        return f"Tutor reply ({len(history)} turns of history): {message}"
+
+    def generate(self, system_instruction, history, message):
+        self._begin_call()
+        time.sleep(self.latency)
+        return self.reply_for(history, message)
+
+    def stream(self, system_instruction, history, message):
+        self._begin_call()
+        words = self.reply_for(history, message).split(" ")
+        step = max(1, -(-len(words) // self.chunks))
+        for i in range(0, len(words), step):
+            time.sleep(self.latency / self.chunks)
+            yield " ".join(words[i:i + step]) + ("" if i + step >= len(words) else " ")
+
+    def describe(self):
+        return {"provider": self.name, "latency": self.latency}
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast for
+    `reset_timeout` seconds; then lets one trial call through (half-open) and
+    closes again if it succeeds. A trial that never reports back (e.g. it was
+    cancelled) stops blocking new trials after another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open":
+            return False
+        now = time.monotonic()
+        if self._trial_started is None or now - self._trial_started >= self.reset_timeout:
+            self._trial_started = now
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold or self._trial_started is not None:
+            if self.opened_at is None:
+                logger.warning(f"LLM circuit breaker opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+            self._trial_started = None
+
+
+class LLMExecutor:
+    """
+    Runs blocking LLM SDK calls off the event loop.
+
+    At most `max_concurrency` calls run at once on a dedicated thread pool, at most
+    `max_queue` callers wait for a slot, and a waiting caller gives up after
+    `queue_timeout` seconds. Anything beyond that is rejected with LLMOverloadedError
+    so the API can answer 503 instead of piling up work behind a slow upstream.
+
+    A slot is held until the pool thread is done, not until the caller stops waiting:
+    a call abandoned by a deadline, a lost hedge or a closed stream keeps counting
+    while it still occupies a thread, so abandoned work cannot pile up in the pool.
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 32, queue_timeout: float = 30.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._running = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+        }
+
+    async def _acquire(self) -> None:
+        if self._slots.locked() and self._waiting >= self.max_queue:
+            raise LLMOverloadedError("LLM queue is full")
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise LLMOverloadedError("Timed out waiting for an LLM slot")
+        finally:
+            self._waiting -= 1
+
+    def _release(self) -> None:
+        self._running -= 1
+        self._slots.release()
+
+    def _submit(self, fn: Callable[[], Any]) -> Future:
+        """Start `fn` on the pool in the slot taken by `_acquire`; the slot is freed when the thread finishes."""
+        loop = asyncio.get_running_loop()
+
+        def release(_: Future) -> None:
+            try:
+                loop.call_soon_threadsafe(self._release)
+            except RuntimeError:  # the loop is closed: nothing is left to hand the slot to
+                pass
+
+        self._running += 1
+        try:
+            future = self._pool.submit(fn)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(release)
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run `fn(*args, **kwargs)` on the LLM thread pool once a slot is free."""
+        return await self.call(functools.partial(fn, *args, **kwargs))
+
+    async def call(
+        self, fn: Callable[[], Any], deadline: Optional[float] = None, started: Optional[asyncio.Event] = None
+    ) -> Any:
+        """
+        Run `fn()` on the LLM thread pool once a slot is free. `deadline` counts from
+        the moment the slot is held, so time spent queueing is only bounded by
+        `queue_timeout` (LLMOverloadedError) and never turns into a TimeoutError.
+        `started` is set once the slot is held.
+        """
+        await self._acquire()
+        if started is not None:
+            started.set()
+        return await asyncio.wait_for(asyncio.wrap_future(self._submit(fn)), deadline)
+
+    def stream(self, fn: Callable[..., Iterable[Any]], *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        """
+        Iterate a blocking generator `fn(*args, **kwargs)` on the LLM thread pool,
+        yielding its items as they arrive. If the consumer stops early (e.g. the
+        client disconnected), the worker stops pulling from the upstream stream.
+        """
+        return self.stream_call(functools.partial(fn, *args, **kwargs))
+
+    async def stream_call(self, fn: Callable[[], Iterable[Any]], deadline: Optional[float] = None) -> AsyncIterator[Any]:
+        """
+        Like `stream` for a zero-argument `fn`. Once a slot is held, `deadline` bounds
+        the wait for the first item and each gap between items (asyncio.TimeoutError).
+        """
+        await self._acquire()
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+        done = object()
+
+        def pump() -> None:
+            try:
+                for item in fn():
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, (done, e))
+            else:
+                loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+
+        self._submit(pump)
+        try:
+            while True:
+                item, error = await asyncio.wait_for(queue.get(), deadline)
+                if item is done:
+                    if error is not None:
+                        raise error
+                    break
+                yield item
+        finally:
+            # The pump stops at the next item it gets from upstream; its slot is freed then
+            cancelled.set()
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+class ResilientLLM:
+    """
+    Async front door to an LLMProvider: every attempt runs on the executor under a
+    `deadline` that starts once it holds a slot, failures are retried up to `retries`
+    times with jittered exponential backoff, an optional hedged second request is
+    fired if the first hasn't answered `hedge_after` seconds after it started, and a
+    circuit breaker turns a struggling upstream into immediate LLMUnavailableError
+    instead of a pile-up of waiting requests. LLMOverloadedError (our own queue is
+    full or the wait for a slot timed out) is never retried and is not an upstream
+    failure, so it never trips the breaker.
+    """
+
+    def __init__(
+        self,
+        provider: LLMProvider,
+        executor: LLMExecutor,
+        deadline: float = 30.0,
+        retries: int = 1,
+        backoff: float = 0.5,
+        hedge_after: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.provider = provider
+        self.executor = executor
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self.hedges = 0
+        self.retried = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            **self.provider.describe(),
+            **self.executor.stats,
+            "breaker": self.breaker.state,
+            "hedges": self.hedges,
+            "retries": self.retried,
+        }
+
+    def _check_breaker(self) -> None:
+        if not self.breaker.allow():
+            raise LLMUnavailableError("LLM circuit breaker is open")
+
+    async def _backoff(self, attempt: int) -> None:
+        self.retried += 1
+        await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    async def _attempt(self, fn: Callable[..., Any], *args: Any) -> Any:
+        call = functools.partial(fn, *args)
+        if self.hedge_after is None or self.hedge_after >= self.deadline:
+            return await self.executor.call(call, self.deadline)
+
+        started = asyncio.Event()
+        primary = asyncio.ensure_future(self.executor.call(call, self.deadline, started))
+        slot = asyncio.ensure_future(started.wait())
+        pending = {primary, slot}
+        try:
+            # The hedge timer starts once the primary holds a slot, not while it queues
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if not primary.done():
+                await asyncio.wait({primary}, timeout=self.hedge_after)
+            if primary.done():
+                return primary.result()
+
+            self.hedges += 1
+            hedge = asyncio.ensure_future(self.executor.call(call, self.deadline - self.hedge_after))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            return primary.result()  # both failed: surface the primary's error
+        finally:
+            slot.cancel()
+            for task in pending:
+                task.cancel()
+
+    async def generate(self, system_instruction: Optional[str], history: List[Dict[str, Any]], message: str) -> str:
+        self._check_breaker()
+        for attempt in range(self.retries + 1):
+            try:
+                result = await self._attempt(self.provider.generate, system_instruction, history, message)
+            except LLMOverloadedError:
+                raise
+            except Exception as e:
+                self.breaker.record_failure()
+                logger.warning(f"LLM attempt {attempt + 1} failed: {type(e).__name__}: {e}")
+                if attempt == self.retries or self.breaker.state != "closed":
+                    raise LLMUnavailableError(str(e) or type(e).__name__) from e
+                await self._backoff(attempt)
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def stream(self, system_instruction: Optional[str], history: List[Dict[str, Any]], message: str) -> AsyncIterator[str]:
+        """
+        Stream a reply. Once the stream holds an executor slot, the deadline bounds the
+        wait for the first chunk and each gap between chunks; retries only happen
+        before the first chunk is delivered.
+        Streams are never hedged, since that would double the upstream token spend.
+        """
+        self._check_breaker()
+        for attempt in range(self.retries + 1):
+            chunks = self.executor.stream_call(
+                functools.partial(self.provider.stream, system_instruction, history, message), self.deadline
+            )
+            delivered = False
+            try:
+                async for chunk in chunks:
+                    delivered = True
+                    yield chunk
+            except LLMOverloadedError:
+                raise
+            except Exception as e:
+                self.breaker.record_failure()
+                logger.warning(f"LLM stream attempt {attempt + 1} failed: {type(e).__name__}: {e}")
+                if delivered or attempt == self.retries or self.breaker.state != "closed":
+                    raise LLMUnavailableError(str(e) or type(e).__name__) from e
+                await self._backoff(attempt)
+            else:
+                self.breaker.record_success()
+                return
+            finally:
+                await chunks.aclose()
+
+
+def _gemini_from_env() -> LLMProvider:
+    from external_integrations.gemini import GeminiProvider
+    return GeminiProvider.from_env()
+
+
+def provider_from_env() -> LLMProvider:
+    """
+    Pick the provider named by LLM_PROVIDER ("gemini" by default, or "fake" for offline use).
+    Gemini is built lazily: its SDK import and API key check happen on first use.
+    """
+    name = os.getenv("LLM_PROVIDER", "gemini").lower()
+    if name == "fake":
+        return FakeLLMProvider(latency=float(os.getenv("FAKE_LLM_LATENCY", 0)))
+    if name == "gemini":
+        return LazyLLMProvider(name, _gemini_from_env)
+    raise ValueError(f"Unknown LLM_PROVIDER: {name}")
+
+
+def resilient_llm_from_env(executor: LLMExecutor) -> ResilientLLM:
+    hedge_after = os.getenv("LLM_HEDGE_AFTER")
+    return ResilientLLM(
+        provider_from_env(),
+        executor,
+        deadline=float(os.getenv("LLM_DEADLINE", 30)),
+        retries=int(os.getenv("LLM_RETRIES", 1)),
+        backoff=float(os.getenv("LLM_RETRY_BACKOFF", 0.5)),
+        hedge_after=float(hedge_after) if hedge_after else None,
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", 5)),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET", 30)),
+        ),
+    )
+
+
+def executor_from_env() -> LLMExecutor:
+    """Build an LLMExecutor from LLM_MAX_CONCURRENCY / LLM_MAX_QUEUE / LLM_QUEUE_TIMEOUT."""
+    executor = LLMExecutor(
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", 8)),
+        max_queue=int(os.getenv("LLM_MAX_QUEUE", 32)),
+        queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", 30)),
+    )
+    logger.info(f"LLM executor ready: {executor.stats}")
+    return executor
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+
+def _mongo_precision(doc: Dict[str, Any]) -> Dict[str, Any]:
+    # BSON dates keep milliseconds; trim now so buffered rows sort and page exactly as they will once stored
+    timestamp = doc.get("timestamp")
+    if timestamp is not None and timestamp.microsecond % 1000:
+        doc = {**doc, "timestamp": timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)}
+    return doc
+
+
+class MessageWriteBuffer:
+    """
+    Write-behind buffer for chat messages.
+
+    `add` queues a message document and returns straight away; queued documents are
+    written with one unordered `insert_many` once `max_batch` of them are waiting or
+    `max_delay` seconds after the first one arrived, whichever comes first. Until a
+    document is stored, `pending_for` returns it so readers in this process still see
+    their own writes. If MongoDB keeps failing, `add` blocks (and eventually raises)
+    once `max_pending` documents are waiting, rather than dropping them.
+    """
+
+    def __init__(self, db, max_batch: int = 100, max_delay: float = 0.2, max_pending: int = 10000):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self._pending: List[Dict[str, Any]] = []
+        self._flushing: List[Dict[str, Any]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.flushes = 0
+        self.written = 0
+        self.failures = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending) + len(self._flushing),
+            "flushes": self.flushes,
+            "written": self.written,
+            "failures": self.failures,
+        }
+
+    async def add(self, doc: Dict[str, Any]) -> None:
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+            if len(self._pending) >= self.max_pending:
+                raise RuntimeError(f"Message write buffer is full ({len(self._pending)} documents pending)")
+        self._pending.append(_mongo_precision(doc))
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._start_flush)
+
+    def pending_for(self, student_id: str) -> List[Dict[str, Any]]:
+        """Documents for `student_id` that are buffered or being written right now."""
+        return [doc for doc in self._flushing + self._pending if doc["student_id"] == student_id]
+
+    def _start_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        """Write everything queued so far. Safe to call at any time; flushes run one at a time."""
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            while self._pending:
+                self._flushing, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+                batch, failed = self._flushing, []
+                try:
+                    # insert_many adds _id to the dicts it is given; keep the buffered copies clean
+                    await self.db.messages.insert_many([dict(doc) for doc in batch], ordered=False)
+                except BulkWriteError as e:
+                    # Duplicate ids were already stored by an earlier, partly failed attempt
+                    failed = [batch[error["index"]] for error in e.details.get("writeErrors", [])
+                              if error.get("code") != 11000]
+                    error_message = str(e)
+                except Exception as e:
+                    failed, error_message = batch, str(e)
+                finally:
+                    self._flushing = []
+                self.written += len(batch) - len(failed)
+                if failed:
+                    self.failures += 1
+                    logger.error(f"Could not write {len(failed)} buffered messages: {error_message}")
+                    # Put them back in order and retry on the next trigger
+                    self._pending[:0] = failed
+                    if self._timer is None:
+                        self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._start_flush)
+                    return
+                self.flushes += 1
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
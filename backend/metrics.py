@@ -0,0 +1,368 @@
+"""
+Prometheus metrics without a client library.
+
+`Metrics` holds the service's counters, gauges and histograms and renders them in the
+Prometheus text format for `GET /metrics`. Recording a value is a dict lookup and a
+few additions under a lock (the Mongo listener runs on driver threads), so it is
+cheap enough to leave on. Values that already live in other objects (cache
+counters, queue depths) are not copied on every request: they are registered as
+callbacks and read only when the endpoint is scraped.
+"""
+import bisect
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+from conversation import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers a fast Mongo lookup up to a slow LLM answer
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in values
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self, lock: threading.Lock):
+        self.value = 0.0
+        self._lock = lock
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...], lock: threading.Lock):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self._lock = lock
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class _Family:
+    """One metric name with a fixed set of label names; `labels(...)` returns the series for given values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_series(self):
+        return _Value(self._lock)
+
+    def labels(self, *values: str):
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                series = self._series.setdefault(values, self._new_series())
+        return series
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        for values, series in list(self._series.items()):
+            yield self.name, _format_labels(self.labelnames, values), series.value
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Family):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramValue(self.bounds, self._lock)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        names = self.labelnames + ("le",)
+        for values, series in list(self._series.items()):
+            with self._lock:
+                counts, total = list(series.counts), series.sum
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(names, values + (_format_value(bound),)), cumulative
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class _Callback(_Family):
+    """Series computed at scrape time: `read()` returns a number, or a dict of label values -> number."""
+
+    def __init__(self, name: str, documentation: str, kind: str, read: Callable[[], Any],
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.read = read
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        values = self.read()
+        if values is None:
+            return
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            if not isinstance(label_values, tuple):
+                label_values = (label_values,)
+            yield self.name, _format_labels(self.labelnames, label_values), value
+
+
+class Metrics:
+    """
+    The service's metrics. HTTP series are recorded by MetricsMiddleware, LLM series by
+    InstrumentedLLM, Mongo series by MongoCommandMetrics; everything else is either
+    recorded at the call site or registered with `callback`.
+    """
+
+    def __init__(self, prefix: str = "aitutor"):
+        self.prefix = prefix
+        self._families: List[_Family] = []
+
+        self.http_requests = self.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+        self.http_latency = self.histogram("http_request_duration_seconds", "HTTP request latency, including streamed bodies", ("method", "route"))
+        self.http_in_flight = self.gauge("http_requests_in_flight", "HTTP requests being served")
+
+        self.llm_latency = self.histogram("llm_request_duration_seconds", "LLM call latency, including retries", ("operation",))
+        self.llm_errors = self.counter("llm_errors_total", "Failed LLM calls by error type", ("operation", "error"))
+        self.llm_tokens = self.counter("llm_tokens_total", "Estimated LLM tokens (about 4 characters per token)", ("direction",))
+
+        self.mongo_latency = self.histogram("mongo_command_duration_seconds", "MongoDB command latency", ("command", "collection"))
+        self.mongo_errors = self.counter("mongo_command_errors_total", "Failed MongoDB commands", ("command", "collection"))
+
+        self.video_bytes = self.counter("video_bytes_total", "Video bytes stored")
+        self.video_chunks = self.counter("video_chunks_total", "Video chunks stored")
+
+    def _add(self, family: _Family) -> _Family:
+        family.name = f"{self.prefix}_{family.name}"
+        self._families.append(family)
+        return family
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, read: Callable[[], Any], kind: str = "gauge",
+                 labelnames: Sequence[str] = ()) -> None:
+        self._add(_Callback(name, documentation, kind, read, labelnames))
+
+    def render(self) -> bytes:
+        lines: List[str] = []
+        for family in self._families:
+            try:
+                samples = list(family.samples())
+            except Exception as e:
+                logger.warning(f"Could not collect metric {family.name}: {e}")
+                continue
+            lines.append(f"# HELP {family.name} {family.documentation}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in samples)
+        lines.append("")
+        return "\n".join(lines).encode()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request count, latency and in-flight requests. Requests are
+    labelled with the route template (`/api/students/{student_id}`), not the raw path,
+    so the number of series stays bounded; anything unrouted is labelled "unmatched".
+    """
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+        self._templates: Optional[Dict[Any, str]] = None
+
+    def _route_template(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._templates is None or endpoint not in self._templates:
+            self._templates = {
+                route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")
+            }
+        return self._templates.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics = self.metrics
+        metrics.http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.http_in_flight.dec()
+            route = self._route_template(scope)
+            metrics.http_latency.labels(scope["method"], route).observe(elapsed)
+            metrics.http_requests.labels(scope["method"], route, str(status)).inc()
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    PyMongo command listener timing every command per collection. Pass it to the client
+    with `event_listeners=[...]`; it is called on the driver's threads.
+    """
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self._collections: Dict[Tuple[Any, int], str] = {}
+
+    @staticmethod
+    def _collection(event: monitoring.CommandStartedEvent) -> str:
+        command = event.command
+        name = command.get("collection") if event.command_name == "getMore" else command.get(event.command_name)
+        return name if isinstance(name, str) else ""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        self._collections[(event.connection_id, event.request_id)] = self._collection(event)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        self.metrics.mongo_latency.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        self.metrics.mongo_latency.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+        self.metrics.mongo_errors.labels(event.command_name, collection).inc()
+
+
+def _tokens(characters: int) -> int:
+    return max(1, characters // CHARS_PER_TOKEN)
+
+
+def _prompt_tokens(system_instruction: Optional[str], history: List[Dict[str, Any]], message: str) -> int:
+    characters = len(system_instruction or "") + len(message)
+    characters += sum(len(part) for turn in history for part in turn.get("parts", []) if isinstance(part, str))
+    return _tokens(characters)
+
+
+class InstrumentedLLM:
+    """
+    Wraps a ResilientLLM, recording latency, errors and estimated tokens per call.
+    Everything else (`stats`, `provider`, ...) is passed through to the wrapped client.
+    """
+
+    def __init__(self, llm, metrics: Metrics):
+        self.llm = llm
+        self.metrics = metrics
+
+    def __getattr__(self, name: str):
+        return getattr(self.llm, name)
+
+    async def generate(self, system_instruction: Optional[str], history: List[Dict[str, Any]], message: str) -> str:
+        metrics = self.metrics
+        metrics.llm_tokens.labels("prompt").inc(_prompt_tokens(system_instruction, history, message))
+        started = time.perf_counter()
+        try:
+            reply = await self.llm.generate(system_instruction, history, message)
+        except Exception as e:
+            metrics.llm_errors.labels("generate", type(e).__name__).inc()
+            raise
+        finally:
+            metrics.llm_latency.labels("generate").observe(time.perf_counter() - started)
+        metrics.llm_tokens.labels("completion").inc(_tokens(len(reply)))
+        return reply
+
+    async def stream(self, system_instruction: Optional[str], history: List[Dict[str, Any]], message: str) -> AsyncIterator[str]:
+        metrics = self.metrics
+        metrics.llm_tokens.labels("prompt").inc(_prompt_tokens(system_instruction, history, message))
+        started = time.perf_counter()
+        characters = 0
+        chunks = self.llm.stream(system_instruction, history, message)
+        try:
+            async for chunk in chunks:
+                characters += len(chunk)
+                yield chunk
+        except Exception as e:
+            metrics.llm_errors.labels("stream", type(e).__name__).inc()
+            raise
+        finally:
+            await chunks.aclose()
+            metrics.llm_latency.labels("stream").observe(time.perf_counter() - started)
+            if characters:
+                metrics.llm_tokens.labels("completion").inc(_tokens(characters))
@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from prerequisites import PrerequisiteGraph
+
+logger = logging.getLogger(__name__)
+
+
+class ModuleCatalog:
+    """
+    In-process copy of the `modules` collection.
+
+    The catalog is read from MongoDB once and then served from memory, together with
+    its pre-encoded JSON body, its prerequisite graph and a version stamp (a hash of
+    the content, so every worker computes the same one). It is re-read at most every
+    `refresh_seconds` to pick up edits made outside this process, or immediately
+    after `invalidate()`.
+    """
+
+    def __init__(self, normalize: Callable[[Dict[str, Any]], Dict[str, Any]], refresh_seconds: float = 300.0):
+        self.normalize = normalize
+        self.refresh_seconds = refresh_seconds
+        self.modules: List[Dict[str, Any]] = []
+        self.body = b"[]"
+        self.version: Optional[str] = None
+        self.graph = PrerequisiteGraph([])
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self.loads = 0
+        self.hits = 0
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.version}"'
+
+    @property
+    def stats(self) -> dict:
+        return {"modules": len(self.modules), "version": self.version, "loads": self.loads, "hits": self.hits}
+
+    async def seed(self, db, defaults: List[Dict[str, Any]]) -> int:
+        """
+        Insert any default module that is missing, keyed on its name. Existing modules are
+        left untouched, so running this on every startup (or from several workers at once)
+        is safe. Returns the number of modules inserted.
+        """
+        if not defaults:
+            return 0
+        result = await db.modules.bulk_write(
+            [UpdateOne({"name": module["name"]}, {"$setOnInsert": module}, upsert=True) for module in defaults],
+            ordered=False,
+        )
+        if result.upserted_count:
+            logger.info(f"Seeded {result.upserted_count} default modules")
+            self.invalidate()
+        return result.upserted_count
+
+    async def load(self, db) -> None:
+        docs = await db.modules.find({}, {"_id": 0}).sort([("difficulty", 1), ("name", 1)]).to_list(None)
+        modules = [self.normalize(doc) for doc in docs]
+        body = json.dumps(modules, default=str, separators=(",", ":")).encode()
+        version = hashlib.blake2b(body, digest_size=8).hexdigest()
+        if version != self.version:
+            logger.info(f"Module catalog loaded: {len(modules)} modules, version {version}")
+        self.modules, self.body, self.version = modules, body, version
+        self.graph = PrerequisiteGraph(modules)
+        self._loaded_at = time.monotonic()
+        self.loads += 1
+
+    async def get(self, db) -> "ModuleCatalog":
+        """Return the catalog, reading it from the database first if it is missing or stale."""
+        if self._is_fresh():
+            self.hits += 1
+            return self
+        async with self._lock:
+            # Another request may have reloaded it while we waited
+            if not self._is_fresh():
+                await self.load(db)
+        return self
+
+    def invalidate(self) -> None:
+        self._loaded_at = 0.0
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """True if an If-None-Match header names the current version."""
+        if not if_none_match or self.version is None:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or any(tag.removeprefix("W/") == self.etag for tag in tags)
+
+    def _is_fresh(self) -> bool:
+        return self.version is not None and time.monotonic() - self._loaded_at < self.refresh_seconds
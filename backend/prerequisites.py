@@ -0,0 +1,141 @@
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class PrerequisiteGraph:
+    """
+    Prerequisite DAG over the module catalog.
+
+    `Module.requirements` may name other modules by name or by id; both are resolved
+    to ids here. A module is unlocked once all of its direct prerequisites are
+    completed. Requirements that match no module, and modules that sit on a cycle,
+    can never be satisfied: they are logged and such modules stay locked.
+    """
+
+    def __init__(self, modules: List[Dict[str, Any]]):
+        by_name = {module["name"]: module["id"] for module in modules}
+        ids = {module["id"] for module in modules}
+        self.requires: Dict[str, Set[str]] = {}
+        self.dependents: Dict[str, Set[str]] = {module_id: set() for module_id in ids}
+        self.unresolved: Dict[str, List[str]] = {}
+        for module in modules:
+            required = set()
+            for requirement in module.get("requirements") or []:
+                required_id = requirement if requirement in ids else by_name.get(requirement)
+                if required_id is None:
+                    self.unresolved.setdefault(module["id"], []).append(requirement)
+                    continue
+                required.add(required_id)
+                self.dependents[required_id].add(module["id"])
+            self.requires[module["id"]] = required
+        self.order, self.cyclic = self._topological_order()
+        for module_id, requirements in self.unresolved.items():
+            logger.warning(f"Module {module_id} requires unknown modules {requirements}; it will stay locked")
+        if self.cyclic:
+            logger.error(f"Module prerequisites form a cycle through {sorted(self.cyclic)}; these modules will stay locked")
+
+    def _topological_order(self):
+        # Kahn's algorithm; whatever is never freed lies on (or behind) a cycle
+        remaining = {module_id: len(required) for module_id, required in self.requires.items()}
+        ready = [module_id for module_id, count in remaining.items() if count == 0]
+        order = []
+        while ready:
+            module_id = ready.pop()
+            order.append(module_id)
+            for dependent in self.dependents[module_id]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        return order, set(self.requires) - set(order)
+
+    def is_locked(self, module_id: str, completed: Set[str]) -> bool:
+        if module_id in self.cyclic or module_id in self.unresolved:
+            return True
+        return not self.requires.get(module_id, set()) <= completed
+
+    def locked(self, completed: Set[str]) -> Dict[str, bool]:
+        """Lock state of every module for a student who has completed `completed` (module ids)."""
+        return {module_id: self.is_locked(module_id, completed) for module_id in self.requires}
+
+    def relock(self, locked: Dict[str, bool], completed: Set[str], changed_module_id: str) -> List[str]:
+        """
+        Update `locked` in place after `changed_module_id` was completed or un-completed.
+        Only its direct dependents can change. Returns the ids whose state flipped.
+        """
+        flipped = []
+        for module_id in self.dependents.get(changed_module_id, ()):
+            now_locked = self.is_locked(module_id, completed)
+            if locked.get(module_id) != now_locked:
+                locked[module_id] = now_locked
+                flipped.append(module_id)
+        return flipped
+
+
+@dataclass
+class StudentModuleState:
+    catalog_version: str
+    progress: Dict[str, Dict[str, Any]]  # module_id -> progress record
+    locked: Dict[str, bool]
+    loaded_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def completed(self) -> Set[str]:
+        return {module_id for module_id, record in self.progress.items() if record.get("completed")}
+
+
+class StudentModuleCache:
+    """
+    LRU of per-student progress and lock state. Entries are tied to a catalog version
+    and re-read after `ttl_seconds` so writes made by other processes show up.
+    Progress writes in this process update the entry incrementally via `record_progress`.
+    """
+
+    def __init__(self, max_students: int = 5000, ttl_seconds: float = 60.0):
+        self.max_students = max_students
+        self.ttl_seconds = ttl_seconds
+        self._states: "OrderedDict[str, StudentModuleState]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self) -> dict:
+        return {"students": len(self._states), "hits": self.hits, "misses": self.misses}
+
+    def get(self, student_id: str, catalog_version: str) -> Optional[StudentModuleState]:
+        state = self._states.get(student_id)
+        if (state is None or state.catalog_version != catalog_version
+                or time.monotonic() - state.loaded_at > self.ttl_seconds):
+            self.misses += 1
+            return None
+        self._states.move_to_end(student_id)
+        self.hits += 1
+        return state
+
+    def build(self, student_id: str, catalog_version: str, graph: PrerequisiteGraph,
+              records: List[Dict[str, Any]]) -> StudentModuleState:
+        progress = {record["module_id"]: record for record in records}
+        state = StudentModuleState(catalog_version, progress, {})
+        state.locked = graph.locked(state.completed)
+        self._states[student_id] = state
+        self._states.move_to_end(student_id)
+        while len(self._states) > self.max_students:
+            self._states.popitem(last=False)
+        return state
+
+    def record_progress(self, record: Dict[str, Any], graph: PrerequisiteGraph) -> None:
+        """Apply one stored progress record to the cached state of its student, if any."""
+        state = self._states.get(record["student_id"])
+        if state is None:
+            return
+        previous = state.progress.get(record["module_id"])
+        state.progress[record["module_id"]] = record
+        if bool(previous and previous.get("completed")) != bool(record.get("completed")):
+            graph.relock(state.locked, state.completed, record["module_id"])
+
+    def clear(self) -> None:
+        self._states.clear()
@@ -0,0 +1,69 @@
+"""
+Sampling profiler for the live process.
+
+`StackSampler.sample(seconds)` snapshots every thread's Python stack `1 / interval`
+times a second with `sys._current_frames()` and counts identical stacks. Nothing is
+hooked into the interpreter, so requests pay only for the brief GIL hold of each
+snapshot, and nothing at all when no profile is running. `collapsed()` renders the
+counts in the folded format read by flamegraph.pl, speedscope and similar tools:
+
+    MainThread;server.py:<module>;...;server.py:_run_chat_turn;conversation.py:load 42
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict
+
+
+class ProfilerBusyError(Exception):
+    """A profile is already running in this process."""
+
+
+class StackSampler:
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._labels: Dict[object, str] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{os.path.basename(code.co_filename)}:{code.co_name}".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    def sample(self, seconds: float) -> Dict[str, int]:
+        """Sample for `seconds` (blocking; run it on a thread). Returns collapsed stack -> sample count."""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("A profile is already running")
+        try:
+            me = threading.get_ident()
+            counts: Counter = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._label(frame.f_code))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, f"thread-{ident}").replace(";", ":").replace(" ", "_"))
+                    counts[";".join(reversed(stack))] += 1
+                time.sleep(self.interval)
+            return dict(counts)
+        finally:
+            self._labels.clear()
+            self._lock.release()
+
+
+def collapsed(counts: Dict[str, int]) -> str:
+    """One `frame;frame;frame count` line per distinct stack, most sampled first."""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items(), key=lambda item: -item[1]))
@@ -0,0 +1,150 @@
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+
+@dataclass
+class RouteLimits:
+    """Sustained rate (requests/second) and burst size, per student and across all students."""
+    per_student_rate: float
+    per_student_burst: float
+    global_rate: float
+    global_burst: float
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until one token is available (0 if one is available now)."""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+
+class RateLimiter:
+    """
+    Token buckets per route class: one per student and one shared by everyone.
+
+    A request is admitted only if both its student's bucket and the global bucket have
+    a token; otherwise neither is charged and `check` returns how long to wait.
+    Idle per-student buckets are dropped LRU-first beyond `max_students` (a dropped
+    bucket would have refilled to full anyway).
+    """
+
+    def __init__(self, limits: Dict[str, RouteLimits], max_students: int = 100000):
+        self.limits = limits
+        self.max_students = max_students
+        self._global = {name: TokenBucket(l.global_rate, l.global_burst) for name, l in limits.items()}
+        self._students: Dict[str, "OrderedDict[str, TokenBucket]"] = {name: OrderedDict() for name in limits}
+        self.counters = {name: {"allowed": 0, "limited_student": 0, "limited_global": 0} for name in limits}
+
+    @property
+    def stats(self) -> dict:
+        return {
+            name: {**self.counters[name], "tracked_students": len(self._students[name])}
+            for name in self.limits
+        }
+
+    def _student_bucket(self, route_class: str, student_id: str) -> TokenBucket:
+        buckets = self._students[route_class]
+        bucket = buckets.get(student_id)
+        if bucket is None:
+            limits = self.limits[route_class]
+            bucket = TokenBucket(limits.per_student_rate, limits.per_student_burst)
+            buckets[student_id] = bucket
+            while len(buckets) > self.max_students:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(student_id)
+        return bucket
+
+    def check(self, route_class: str, student_id: Optional[str]) -> float:
+        """Charge one request; returns 0 if admitted, else the seconds to wait before retrying."""
+        if route_class not in self.limits:
+            return 0.0
+        now = time.monotonic()
+        global_bucket = self._global[route_class]
+        global_bucket.refill(now)
+        student_bucket = self._student_bucket(route_class, student_id) if student_id else None
+        if student_bucket is not None:
+            student_bucket.refill(now)
+            wait = student_bucket.wait_time()
+            if wait:
+                self.counters[route_class]["limited_student"] += 1
+                return wait
+        wait = global_bucket.wait_time()
+        if wait:
+            self.counters[route_class]["limited_global"] += 1
+            return wait
+        global_bucket.tokens -= 1
+        if student_bucket is not None:
+            student_bucket.tokens -= 1
+        self.counters[route_class]["allowed"] += 1
+        return 0.0
+
+
+class InFlightLimiter:
+    """
+    Caps concurrent HTTP requests. Past `max_in_flight`, requests are answered at once
+    with 503 and Retry-After instead of queueing behind the others, so latency for
+    admitted requests stays flat under overload. Installed with InFlightMiddleware.
+    """
+
+    def __init__(self, max_in_flight: int = 256, retry_after: int = 1):
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.rejected = 0
+
+    @property
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight, "max_in_flight": self.max_in_flight, "rejected": self.rejected}
+
+
+class InFlightMiddleware:
+    """
+    ASGI middleware applying an InFlightLimiter to HTTP requests. Paths in `exempt_paths`
+    (health checks, metrics scrapes) are neither counted nor refused, so an overloaded
+    worker is not also restarted for failing its probes.
+    """
+
+    def __init__(self, app, limiter: InFlightLimiter, exempt_paths: Tuple[str, ...] = ()):
+        self.app = app
+        self.limiter = limiter
+        self.exempt_paths = frozenset(exempt_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        limiter = self.limiter
+        if limiter.in_flight >= limiter.max_in_flight:
+            limiter.rejected += 1
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(limiter.retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": b'{"detail":"Server busy, please retry"}'})
+            return
+        limiter.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.in_flight -= 1
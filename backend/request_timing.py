@@ -0,0 +1,147 @@
+"""
+Per-request phase timings, sent back in a `Server-Timing` header.
+
+ServerTimingMiddleware starts a RequestTimings for each HTTP request and keeps it in a
+context variable, so code anywhere below it (including MongoDB commands, which Motor
+runs on threads with a copy of the caller's context) can add the time it spent to a
+named phase. The header lists every recorded phase plus `total`, the time until the
+response started; browser dev tools show it next to the request. Background work a
+request starts (a history fold, a write-behind flush) inherits its context and is
+counted too while the request is still running.
+
+    Server-Timing: db;dur=4.1;desc="3 commands", llm;dur=812.5, serialize;dur=0.3, total;dur=818.2
+"""
+import asyncio
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+
+_current: ContextVar[Optional["RequestTimings"]] = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Seconds spent per phase in one request. Phases that run concurrently are summed."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.endpoint_returned: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+            self.counts[phase] = self.counts.get(phase, 0) + 1
+
+    def header(self) -> str:
+        total = time.perf_counter() - self.started
+        parts = []
+        for phase, seconds in self.phases.items():
+            part = f"{phase};dur={seconds * 1000:.1f}"
+            if phase == "db":
+                count = self.counts[phase]
+                part += f';desc="{count} command{"" if count == 1 else "s"}"'
+            parts.append(part)
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def record(phase: str, seconds: float) -> None:
+    """Add `seconds` to `phase` of the current request, if there is one."""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware adding the Server-Timing header to every HTTP response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            _current.reset(token)
+
+
+class TimedRoute(APIRoute):
+    """
+    APIRoute that records the `serialize` phase: the time between the endpoint function
+    returning and FastAPI handing over the response (response_model validation and JSON
+    encoding). Use it as an APIRouter's `route_class`.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        if asyncio.iscoroutinefunction(self.dependant.call):
+            # FastAPI has already read the endpoint's signature; only the function it calls is swapped
+            self.dependant.call = _marking_return(self.dependant.call)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            timings = _current.get()
+            if timings is not None and timings.endpoint_returned is not None:
+                timings.add("serialize", time.perf_counter() - timings.endpoint_returned)
+            return response
+
+        return timed_handler
+
+
+def _marking_return(call):
+    @functools.wraps(call)
+    async def marked(*args, **kwargs):
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            timings = _current.get()
+            if timings is not None:
+                timings.endpoint_returned = time.perf_counter()
+
+    return marked
+
+
+class MongoTimingListener(monitoring.CommandListener):
+    """PyMongo command listener adding each command's duration to the request's `db` phase."""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        record("db", event.duration_micros / 1e6)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        record("db", event.duration_micros / 1e6)
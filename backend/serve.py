@@ -0,0 +1,41 @@
+"""
+Production entry point: serves `server:app` with uvicorn in WEB_CONCURRENCY worker
+processes, so JSON encoding, base64 decoding and validation use every core.
+
+    WEB_CONCURRENCY=auto python serve.py
+
+Each worker imports the app in a fresh (spawned) process and so creates its own
+MongoDB client, LLM client, caches and limiters; see "Running several workers" in
+the README for what that means for consistency.
+"""
+import os
+
+import uvicorn
+
+
+def worker_count(value: str) -> int:
+    """WEB_CONCURRENCY as a number of processes; "auto" is one per CPU."""
+    if value.strip().lower() == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(value))
+
+
+def main() -> None:
+    workers = worker_count(os.getenv("WEB_CONCURRENCY", "1"))
+    # Workers inherit the environment; the app reads the resolved count to split box-wide budgets
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    uvicorn.run(
+        "server:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", 8001)),
+        workers=workers,
+        timeout_keep_alive=int(os.getenv("KEEP_ALIVE_TIMEOUT", 5)),
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", 30)),
+        backlog=int(os.getenv("LISTEN_BACKLOG", 2048)),
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        log_level=os.getenv("LOG_LEVEL", "info").lower(),
+    )
+
+
+if __name__ == "__main__":
+    main()
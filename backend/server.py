@@ -1,19 +1,48 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Body, File, UploadFile
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Body, File, UploadFile, Header, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from datetime import datetime
 import os
+import asyncio
 import logging
 import uuid
+import math
+import hmac
 import json
 import base64
 import io
 from pathlib import Path
 from dotenv import load_dotenv
-import google.generativeai as genai
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+from external_integrations.llm import (
+    LLMOverloadedError,
+    LLMUnavailableError,
+    executor_from_env,
+    resilient_llm_from_env,
+)
+from chat_socket import EventSender, SlowClientError, TurnQueue
+from conversation import ConversationMemory, ConversationWindow
+from message_buffer import MessageWriteBuffer
+from answer_cache import AnswerCache
+from singleflight import SingleFlight
+from db_indexes import IndexBuildError, check_query_plans, ensure_indexes
+from database import LazyDatabase, client_options_from_env
+from fast_json import DefaultResponse, RowEncoder
+from module_catalog import ModuleCatalog
+from prerequisites import StudentModuleCache
+from video_store import ChunkTooLargeError, DuplicateChunkError, SegmentStore
+from video_sessions import VideoSessionClosedError, VideoSessionManager, VideoSessionNotFoundError
+from engagement import EngagementPipeline
+from rate_limit import InFlightLimiter, InFlightMiddleware, RateLimiter, RouteLimits
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, InstrumentedLLM, Metrics, MetricsMiddleware, MongoCommandMetrics
+import request_timing
+from request_timing import MongoTimingListener, ServerTimingMiddleware, TimedRoute
+from profiler import ProfilerBusyError, StackSampler, collapsed
 
 # Configure logging first as it's used early
 logging.basicConfig(
@@ -26,43 +55,141 @@ logger = logging.getLogger(__name__)
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# Set up Google Generative AI
-google_api_key = os.getenv("GOOGLE_AI_API_KEY")
-if not google_api_key:
-    logger.error("GOOGLE_AI_API_KEY not found in environment variables. Please set it in backend/.env")
-    raise ValueError("GOOGLE_AI_API_KEY not found in environment variables.")
-genai.configure(api_key=google_api_key)
-
-generation_config = {
-    "temperature": 0.9,
-    "top_p": 1,
-    "top_k": 1,
-    "max_output_tokens": 2048,
-}
-model = genai.GenerativeModel(
-    model_name="gemini-1.5-pro-latest",
-    generation_config=generation_config
+# Prometheus metrics, served at /metrics; recording is cheap enough to leave on in production
+metrics = Metrics() if os.getenv("METRICS_ENABLED", "true").lower() == "true" else None
+# Server-Timing header (db, llm, serialize, total) on every response
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+
+# Set up the LLM provider (Gemini unless LLM_PROVIDER says otherwise).
+# SDK calls are blocking; they run on a bounded pool so they never stall the event loop,
+# behind per-call deadlines, retries and a circuit breaker.
+llm_executor = executor_from_env()
+llm = resilient_llm_from_env(llm_executor)
+if metrics:
+    llm = InstrumentedLLM(llm, metrics)
+
+# MongoDB connection; the client is created by the first query, inside the event loop
+mongo_listeners = []
+if metrics:
+    mongo_listeners.append(MongoCommandMetrics(metrics))
+if SERVER_TIMING_ENABLED:
+    mongo_listeners.append(MongoTimingListener())
+db = LazyDatabase(os.getenv("MONGO_URL"), os.getenv("DB_NAME"), event_listeners=mongo_listeners, **client_options_from_env())
+
+async def _summarize_conversation(previous_summary: Optional[str], turns: List[Dict[str, Any]]) -> str:
+    """Fold older turns into the rolling summary with one LLM call."""
+    transcript = "\n".join(
+        f"{'Student' if turn['role'] == 'student' else 'Tutor'}: {turn['content']}" for turn in turns
+    )
+    prompt = (
+        "You keep short notes on a tutoring conversation. Update the notes with the new exchanges below. "
+        "Keep what the student is learning, what they struggled with and any preferences they mentioned. "
+        "Answer with the updated notes only, in under 200 words.\n\n"
+        f"Current notes: {previous_summary or '(none yet)'}\n\nNew exchanges:\n{transcript}"
+    )
+    return await llm.generate(None, [], prompt)
+
+# Optional write-behind for chat messages: batched insert_many instead of one insert per turn
+message_buffer = MessageWriteBuffer(
+    db,
+    max_batch=int(os.getenv("MESSAGE_WRITE_BATCH", 100)),
+    max_delay=float(os.getenv("MESSAGE_WRITE_DELAY", 0.2)),
+) if os.getenv("MESSAGE_WRITE_BEHIND", "false").lower() == "true" else None
+
+# The backend owns chat history: recent turns within a token budget, older ones folded into a summary
+conversation_memory = ConversationMemory(
+    db,
+    summarize=_summarize_conversation,
+    token_budget=int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", 2000)),
+    max_turns=int(os.getenv("CHAT_HISTORY_MAX_TURNS", 100)),
+    fold_to=float(os.getenv("CHAT_HISTORY_FOLD_TO", 0.5)),
+    pending=message_buffer.pending_for if message_buffer else None,
 )
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Answers to standalone questions are shared across students in the same grade and module.
+# Off by default: only a conversation's first message, or one the client marks standalone, is cached
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", 2000)),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", 24 * 3600)),
+    near_duplicates=os.getenv("ANSWER_CACHE_NEAR_DUPLICATES", "false").lower() == "true",
+) if os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true" else None
+
+# Worker processes serving this app (set by serve.py); each holds its own limiter state
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+def _route_limits(prefix: str, student_rate: float, student_burst: float, global_rate: float, global_burst: float):
+    # The global budget is for the whole box, so each worker enforces its share of it
+    return RouteLimits(
+        per_student_rate=float(os.getenv(f"RATE_LIMIT_{prefix}_STUDENT_RATE", student_rate)),
+        per_student_burst=float(os.getenv(f"RATE_LIMIT_{prefix}_STUDENT_BURST", student_burst)),
+        global_rate=float(os.getenv(f"RATE_LIMIT_{prefix}_GLOBAL_RATE", global_rate)) / WEB_CONCURRENCY,
+        global_burst=max(1.0, float(os.getenv(f"RATE_LIMIT_{prefix}_GLOBAL_BURST", global_burst)) / WEB_CONCURRENCY),
+    )
+
+# Token buckets per student and overall, with separate budgets for the expensive route classes:
+# chat spends LLM quota, video writes to disk every couple of seconds per camera
+rate_limiter = RateLimiter({
+    "chat": _route_limits("CHAT", 0.5, 5, 20, 40),
+    "video": _route_limits("VIDEO", 2, 10, 200, 400),
+}) if os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true" else None
+
+async def _bootstrap_database() -> None:
+    try:
+        await ensure_indexes(db)
+        if os.getenv("QUERY_PLAN_CHECK", "false").lower() == "true":
+            await check_query_plans(db)
+    except IndexBuildError as e:
+        # Progress upserts and module seeding rely on the unique indexes: never become ready without them
+        logger.critical(f"MongoDB index bootstrap failed: {e}")
+        raise
+    except Exception as e:
+        # Keep serving; the routes still work without indexes, just slower
+        logger.error(f"MongoDB index bootstrap failed: {e}", exc_info=True)
+    try:
+        await module_catalog.seed(db, [module.dict() for module in DEFAULT_MODULES])
+        await module_catalog.load(db)
+    except Exception as e:
+        # get_modules loads the catalog on first use if this fails
+        logger.error(f"Module catalog bootstrap failed: {e}", exc_info=True)
+
+async def _warm_up_llm() -> None:
+    # Imports and configures the model SDK now rather than in the first chat request
+    try:
+        await asyncio.to_thread(llm.provider.load)
+    except Exception as e:
+        logger.error(f"LLM provider could not be set up: {e}")
+
+# Background startup work; /readyz reports ready once it has finished
+startup_tasks: List[asyncio.Task] = []
 
 @asynccontextmanager
 async def lifespan(app_instance: FastAPI):
-    # Startup logic can go here if needed
-    logger.info("Application startup: MongoDB client initialized.")
+    # Indexes, module seeding and the LLM SDK are set up in the background so the
+    # server accepts connections (and answers /healthz) right away
+    startup_tasks[:] = [asyncio.create_task(_bootstrap_database()), asyncio.create_task(_warm_up_llm())]
+    video_compaction = asyncio.create_task(video_sessions.run_compaction(VIDEO_COMPACTION_INTERVAL))
+    if engagement:
+        engagement.start()
     yield
     # Shutdown logic
     logger.info("Application shutdown: Closing MongoDB client.")
-    client.close()
+    for task in startup_tasks:
+        task.cancel()
+    video_compaction.cancel()
+    if engagement:
+        await engagement.stop()
+    await video_sessions.wait_for_finalizing()
+    await conversation_memory.wait_for_folds()
+    if message_buffer:
+        await message_buffer.close()
+    db.close()
+    llm_executor.shutdown()
 
 # Create the main app with the lifespan manager
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=DefaultResponse)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=TimedRoute)
 
 # Define Models
 class Student(BaseModel):
@@ -98,6 +225,20 @@ class ProgressRecord(BaseModel):
     score: Optional[float] = None
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+# List endpoints encode these rows straight from MongoDB (see fast_json.py)
+message_rows = RowEncoder(Message)
+progress_rows = RowEncoder(ProgressRecord)
+
+class ProgressUpdate(BaseModel):
+    student_id: str
+    module_id: str
+    module_name: str
+    completed: bool
+    score: Optional[float] = None
+
+class ProgressBatch(BaseModel):
+    updates: List[ProgressUpdate] = Field(..., min_length=1, max_length=500)
+
 class Module(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -107,6 +248,64 @@ class Module(BaseModel):
     locked: bool = True
     requirements: Optional[List[str]] = None
 
+def _module_id(name: str) -> str:
+    # Stable across databases and restarts, so seeding is an idempotent upsert
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"ai-tutor/modules/{name}"))
+
+DEFAULT_MODULES = [
+    Module(
+        id=_module_id("Introduction to Numbers"),
+        name="Introduction to Numbers",
+        description="Learn about numbers and basic operations",
+        subject="Math",
+        difficulty=1,
+        locked=False,
+    ),
+    Module(
+        id=_module_id("Reading Comprehension"),
+        name="Reading Comprehension",
+        description="Improve your understanding of written text",
+        subject="English",
+        difficulty=1,
+        locked=False,
+    ),
+    Module(
+        id=_module_id("Basic Science Concepts"),
+        name="Basic Science Concepts",
+        description="Introduction to science fundamentals",
+        subject="Science",
+        difficulty=1,
+        locked=False,
+    ),
+    Module(
+        id=_module_id("Advanced Mathematics"),
+        name="Advanced Mathematics",
+        description="Complex math operations and problem solving",
+        subject="Math",
+        difficulty=3,
+        locked=True,
+        requirements=["Introduction to Numbers"]
+    ),
+]
+
+# The catalog rarely changes: serve it from memory with an ETag instead of a query per page load
+module_catalog = ModuleCatalog(
+    normalize=lambda doc: Module(**doc).dict(),
+    refresh_seconds=float(os.getenv("MODULE_CATALOG_REFRESH", 300)),
+)
+
+# Per-student progress and unlock state, updated in place as progress is recorded
+student_modules = StudentModuleCache(
+    max_students=int(os.getenv("STUDENT_MODULES_CACHE_SIZE", 5000)),
+    ttl_seconds=float(os.getenv("STUDENT_MODULES_CACHE_TTL", 60)),
+)
+
+class StudentModules(BaseModel):
+    student_id: str
+    catalog_version: str
+    modules: List[Module]  # `locked` evaluated for this student
+    progress: List[ProgressRecord]
+
 class VideoFrame(BaseModel):
     student_id: str
     frame_data: str  # Base64 encoded data
@@ -132,25 +331,118 @@ async def get_student(student_id: str):
         return Student(**student)
     raise HTTPException(status_code=404, detail="Student not found")
 
+async def _store_message(message: Message) -> None:
+    if message_buffer:
+        await message_buffer.add(message.dict())
+    else:
+        await db.messages.insert_one(message.dict())
+
 @api_router.post("/messages", response_model=Message)
 async def create_message(message: MessageCreate):
     message_obj = Message(**message.dict())
-    await db.messages.insert_one(message_obj.dict())
+    await _store_message(message_obj)
     return message_obj
 
-@api_router.get("/messages/{student_id}", response_model=List[Message])
-async def get_messages(student_id: str):
-    messages = await db.messages.find({"student_id": student_id}).sort("timestamp", 1).to_list(100)
-    return [Message(**msg) for msg in messages]
+MESSAGES_PAGE_MAX = 200
 
-@api_router.post("/chat", response_model=Dict[str, Any])
-async def chat_with_tutor(
-    student_id: str = Body(...),
-    message: str = Body(...),
-    context: Optional[List[Dict[str, str]]] = Body(default=[])
+def _encode_message_cursor(message: Dict[str, Any]) -> str:
+    raw = json.dumps([message["timestamp"].isoformat(), message["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_message_cursor(cursor: str):
+    try:
+        timestamp, message_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(timestamp), message_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@api_router.get("/messages/{student_id}", response_model=List[Message])
+async def get_messages(
+    student_id: str,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(default=50, ge=1, le=MESSAGES_PAGE_MAX)
 ):
+    """
+    One page of a student's messages, newest first, keyset-paginated on (timestamp, id).
+    `X-Next-Cursor` (pass as `before`) is set when older messages exist and
+    `X-Prev-Cursor` (pass as `after`) when newer ones do.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    query: Dict[str, Any] = {"student_id": student_id}
+    cursor, op = (before, "$lt") if before else (after, "$gt")
+    if cursor:
+        timestamp, message_id = _decode_message_cursor(cursor)
+        query["$or"] = [
+            {"timestamp": {op: timestamp}},
+            {"timestamp": timestamp, "id": {op: message_id}},
+        ]
+
+    # Walk the (student_id, timestamp, id) index away from the cursor; fetch one extra row to know if more exist
+    direction = 1 if after else -1
+    messages = await db.messages.find(query, message_rows.projection).sort(
+        [("timestamp", direction), ("id", direction)]
+    ).limit(limit + 1).to_list(limit + 1)
+    if message_buffer:
+        # Read your own writes: merge rows still waiting in the write-behind buffer
+        key = (timestamp, message_id) if cursor else None
+        buffered = [
+            m for m in message_buffer.pending_for(student_id)
+            if key is None or ((m["timestamp"], m["id"]) < key if before else (m["timestamp"], m["id"]) > key)
+        ]
+        if buffered:
+            stored = {m["id"] for m in messages}
+            messages += [m for m in buffered if m["id"] not in stored]
+            messages.sort(key=lambda m: (m["timestamp"], m["id"]), reverse=direction == -1)
+            messages = messages[:limit + 1]
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if after:
+        messages.reverse()
+
+    headers = {}
+    if messages:
+        if (has_more and not after) or after:
+            headers["X-Next-Cursor"] = _encode_message_cursor(messages[-1])
+        if (has_more and after) or before:
+            headers["X-Prev-Cursor"] = _encode_message_cursor(messages[0])
+    return message_rows.response(messages, headers)
+
+def _build_persona(student: Dict[str, Any]) -> str:
+    interests = ", ".join(student.get("interests") or [])
+    persona = f"""You are Synthesis Tutor 2.0, an AI tutor for a student named {student['name']}. 
+    Your goal is to be helpful, supportive, and personalized in your teaching approach.
+    Keep your answers friendly and conversational for a student in grade {student.get('grade') or 'school'}.
+    Explain concepts clearly and provide interactive examples when possible.
+    """
+    if interests:
+        persona += f"When it helps, use examples related to their interests: {interests}.\n"
+    return persona
+
+def _shared_persona(student: Dict[str, Any]) -> str:
+    """The persona for answers that go into the answer cache: the grade only, nothing about this student."""
+    return f"""You are Synthesis Tutor 2.0, an AI tutor for students in grade {student.get('grade') or 'school'}.
+    Your goal is to be helpful and supportive in your teaching approach.
+    Keep your answers friendly and conversational, without addressing the student by name.
+    Explain concepts clearly and provide interactive examples when possible.
+    """
+
+def _tutor_prompt(student: Dict[str, Any], history: List[Dict[str, Any]],
+                 cache_scope) -> Tuple[str, List[Dict[str, Any]]]:
+    """(persona, history) for a model call. An answer that will be cached is shared with the
+    whole grade and module, so it is generated from the question alone."""
+    if cache_scope:
+        return _shared_persona(student), []
+    return _build_persona(student), history
+
+async def _prepare_chat_turn(student_id: str, message: str):
+    """Load the student and their conversation window, then store their new message."""
     # Retrieve student information for personalization
-    student = await db.students.find_one({"id": student_id})
+    student, window = await asyncio.gather(
+        db.students.find_one({"id": student_id}),
+        conversation_memory.load(student_id),
+    )
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
 
@@ -160,44 +452,89 @@ async def chat_with_tutor(
         content=message,
         role="student"
     )
-    await db.messages.insert_one(student_message.dict())
-
-    # Format context for the AI model (previous conversation)
-    chat_context = []
-    if context:
-        for msg in context:
-            if msg["role"] == "student":
-                chat_context.append({"role": "user", "parts": [msg["content"]]})
-            else:
-                chat_context.append({"role": "model", "parts": [msg["content"]]})
-    
-    # Add current message
-    chat_context.append({"role": "user", "parts": [message]})
-    
-    # Prepare chat context
-    if not context:
-        # Add personalized prompt as the first "model" message instead of system prompt
-        # (Gemini doesn't support system role)
-        personalized_prompt = f"""You are Synthesis Tutor 2.0, an AI tutor for a student named {student['name']}. 
-        Your goal is to be helpful, supportive, and personalized in your teaching approach.
-        Keep your answers friendly and conversational for a student in grade {student.get('grade', 'school')}.
-        Explain concepts clearly and provide interactive examples when possible.
-        """
-        
-        # Initialize the chat with an empty history
-        chat = model.start_chat(history=[])
-        
-        # Send the personalized prompt as a hidden "instruction" message
-        # Then we'll use the regular message
-        instruction_response = chat.send_message(
-            f"Please respond to the student as if you are an AI tutor with these instructions: {personalized_prompt}"
+    await _store_message(student_message)
+
+    conversation_memory.schedule_fold(student_id, window)
+    return student, window
+
+# Double-clicked sends and client retries of the same chat turn share one model call and one pair of writes
+# A duplicate waits for the original turn at most 120s (longer than any model deadline)
+chat_requests = SingleFlight(replay_window=float(os.getenv("CHAT_REPLAY_WINDOW", 10)), follower_timeout=120.0)
+
+def _chat_request_key(student_id: str, message: str, idempotency_key: Optional[str]):
+    return (student_id, message, idempotency_key)
+
+def _answer_cache_scope(student: Dict[str, Any], message: str, module_id: Optional[str],
+                        history: List[Dict[str, Any]], standalone: bool):
+    """Return (grade, module) to look the answer up under, or None if this message must go to the model.
+    Any message may build on the conversation before it, so only one with no history behind it
+    (or that the client marks `standalone`) is shared."""
+    if answer_cache is None or not answer_cache.cacheable(message, standalone=standalone or not history):
+        return None
+    return student.get("grade"), module_id
+
+# Shown instead of an error page when the model is down or too slow
+TUTOR_FALLBACK_MESSAGE = (
+    "I'm having a little trouble thinking right now. "
+    "Let's try that again in a moment, or pick a module to keep practicing!"
+)
+
+def _tutor_busy_error() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="The tutor is busy right now. Please try again in a moment.",
+        headers={"Retry-After": "5"},
+    )
+
+def _enforce_rate_limit(route_class: str, key: Optional[str]) -> None:
+    """Raise 429 with Retry-After if `key` (a student) is over the route class budget."""
+    if not rate_limiter:
+        return
+    wait = rate_limiter.check(route_class, key)
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests. Please slow down.",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
         )
-    else:
-        chat = model.start_chat(history=chat_context[:-1])
 
-    # Generate response from AI
-    response = chat.send_message(message)
-    tutor_response = response.text
+@api_router.post("/chat", response_model=Dict[str, Any])
+async def chat_with_tutor(
+    student_id: str = Body(...),
+    message: str = Body(...),
+    context: Optional[List[Dict[str, str]]] = Body(default=None),  # Deprecated: history is loaded server-side
+    module_id: Optional[str] = Body(default=None),
+    standalone: bool = Body(default=False),
+    client_request_id: Optional[str] = Body(default=None),
+    idempotency_key: Optional[str] = Header(default=None)
+):
+    _enforce_rate_limit("chat", student_id)
+    key = _chat_request_key(student_id, message, idempotency_key or client_request_id)
+    try:
+        return await chat_requests.do(key, lambda: _run_chat_turn(student_id, message, module_id, standalone))
+    except asyncio.TimeoutError:
+        # A duplicate whose original turn is still not done
+        raise _tutor_busy_error()
+    except LLMUnavailableError as e:
+        logger.warning(f"Tutor unavailable for student {student_id}, sending fallback: {e}")
+        return {"response": TUTOR_FALLBACK_MESSAGE, "student_id": student_id, "fallback": True}
+
+async def _run_chat_turn(student_id: str, message: str, module_id: Optional[str], standalone: bool) -> Dict[str, Any]:
+    student, window = await _prepare_chat_turn(student_id, message)
+
+    history = window.to_gemini_history()
+    cache_scope = _answer_cache_scope(student, message, module_id, history, standalone)
+    tutor_response = answer_cache.get(message, *cache_scope) if cache_scope else None
+    if tutor_response is None:
+        # Generate response from AI off the event loop
+        try:
+            with request_timing.phase("llm"):
+                tutor_response = await llm.generate(*_tutor_prompt(student, history, cache_scope), message)
+        except LLMOverloadedError as e:
+            logger.warning(f"Rejecting chat for student {student_id}: {e}")
+            raise _tutor_busy_error()
+        if cache_scope:
+            answer_cache.put(message, *cache_scope, tutor_response)
     
     # Save the tutor's response to the database
     tutor_message = Message(
@@ -205,58 +542,148 @@ async def chat_with_tutor(
         content=tutor_response,
         role="tutor"
     )
-    await db.messages.insert_one(tutor_message.dict())
+    await _store_message(tutor_message)
     
     return {
         "response": tutor_response,
         "student_id": student_id
     }
 
+@api_router.get("/chat/cache-stats", response_model=Dict[str, Any])
+async def get_answer_cache_stats():
+    if answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **answer_cache.stats}
+
+def _sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    payload = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
+
+async def _replay_chat_stream(shared: asyncio.Future):
+    """SSE for a duplicate request: wait for the original turn, then send its reply in one go."""
+    try:
+        result = await chat_requests.wait(shared)
+    except asyncio.CancelledError:
+        if not shared.cancelled():
+            raise
+        result = None
+    except Exception:
+        result = None
+    if result is None:
+        yield _sse_event({"detail": "The tutor could not finish this answer."}, event="error")
+        return
+    yield _sse_event({"token": result["response"]})
+    yield _sse_event(result, event="done")
+
+@api_router.post("/chat/stream")
+async def chat_with_tutor_stream(
+    student_id: str = Body(...),
+    message: str = Body(...),
+    context: Optional[List[Dict[str, str]]] = Body(default=None),  # Deprecated: history is loaded server-side
+    module_id: Optional[str] = Body(default=None),
+    standalone: bool = Body(default=False),
+    client_request_id: Optional[str] = Body(default=None),
+    idempotency_key: Optional[str] = Header(default=None)
+):
+    """
+    Same as /chat, but forwards the reply as Server-Sent Events while the model produces it.
+    Emits `data: {"token": ...}` per chunk, then an `event: done` carrying the full reply,
+    or an `event: error`. The tutor message is stored once, only if the stream completes;
+    a client disconnect stops the upstream stream and nothing is stored.
+    Duplicates of an in-flight or just-finished turn get the original reply in one event.
+    """
+    _enforce_rate_limit("chat", student_id)
+    sse_headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    key = _chat_request_key(student_id, message, idempotency_key or client_request_id)
+    leader, shared = chat_requests.begin(key)
+    if not leader:
+        return StreamingResponse(_replay_chat_stream(shared), media_type="text/event-stream", headers=sse_headers)
+
+    try:
+        student, window = await _prepare_chat_turn(student_id, message)
+    except BaseException as e:
+        chat_requests.fail(key, e)
+        raise
+    history = window.to_gemini_history()
+    cache_scope = _answer_cache_scope(student, message, module_id, history, standalone)
+    cached_response = answer_cache.get(message, *cache_scope) if cache_scope else None
+
+    async def event_stream():
+        parts = []
+        try:
+            try:
+                if cached_response is not None:
+                    parts.append(cached_response)
+                    yield _sse_event({"token": cached_response})
+                else:
+                    persona, prompt_history = _tutor_prompt(student, history, cache_scope)
+                    async for token in llm.stream(persona, prompt_history, message):
+                        parts.append(token)
+                        yield _sse_event({"token": token})
+            except LLMOverloadedError as e:
+                logger.warning(f"Rejecting chat stream for student {student_id}: {e}")
+                chat_requests.fail(key, e)
+                yield _sse_event({"detail": _tutor_busy_error().detail}, event="error")
+                return
+            except LLMUnavailableError as e:
+                logger.warning(f"Tutor unavailable for student {student_id}: {e}")
+                chat_requests.fail(key, e)
+                if parts:
+                    yield _sse_event({"detail": "The tutor could not finish this answer."}, event="error")
+                else:
+                    yield _sse_event({"token": TUTOR_FALLBACK_MESSAGE})
+                    yield _sse_event(
+                        {"response": TUTOR_FALLBACK_MESSAGE, "student_id": student_id, "fallback": True},
+                        event="done",
+                    )
+                return
+            except asyncio.CancelledError as e:
+                logger.info(f"Chat stream for student {student_id} cancelled by client")
+                chat_requests.fail(key, e)
+                raise
+            except Exception as e:
+                logger.error(f"Error streaming tutor reply: {str(e)}", exc_info=True)
+                chat_requests.fail(key, e)
+                yield _sse_event({"detail": "The tutor could not finish this answer."}, event="error")
+                return
+
+            tutor_message = Message(
+                student_id=student_id,
+                content="".join(parts),
+                role="tutor"
+            )
+            await _store_message(tutor_message)
+            if cache_scope and cached_response is None:
+                answer_cache.put(message, *cache_scope, tutor_message.content)
+            result = {"response": tutor_message.content, "student_id": student_id, "message_id": tutor_message.id}
+            chat_requests.finish(key, result)
+            yield _sse_event(result, event="done")
+        finally:
+            # A no-op once finished. Otherwise the stream ended early, e.g. the client went away while a
+            # send was blocked (which closes this generator): release the key so retries aren't stuck on it
+            chat_requests.fail(key, asyncio.CancelledError())
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=sse_headers)
+
 @api_router.get("/modules", response_model=List[Module])
-async def get_modules():
-    modules = await db.modules.find().to_list(100)
-    if not modules:
-        # If no modules exist, create default ones
-        default_modules = [
-            Module(
-                id=str(uuid.uuid4()),
-                name="Introduction to Numbers",
-                description="Learn about numbers and basic operations",
-                subject="Math",
-                difficulty=1,
-                locked=False,
-            ),
-            Module(
-                id=str(uuid.uuid4()),
-                name="Reading Comprehension",
-                description="Improve your understanding of written text",
-                subject="English",
-                difficulty=1,
-                locked=False,
-            ),
-            Module(
-                id=str(uuid.uuid4()),
-                name="Basic Science Concepts",
-                description="Introduction to science fundamentals",
-                subject="Science",
-                difficulty=1,
-                locked=False,
-            ),
-            Module(
-                id=str(uuid.uuid4()),
-                name="Advanced Mathematics",
-                description="Complex math operations and problem solving",
-                subject="Math",
-                difficulty=3,
-                locked=True,
-                requirements=["Introduction to Numbers"]
-            ),
-        ]
-        for module in default_modules:
-            await db.modules.insert_one(module.dict())
-        return default_modules
-    
-    return [Module(**module) for module in modules]
+async def get_modules(if_none_match: Optional[str] = Header(default=None)):
+    catalog = await module_catalog.get(db)
+    headers = {"ETag": catalog.etag, "Cache-Control": "no-cache"}
+    if catalog.matches(if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(content=catalog.body, media_type="application/json", headers=headers)
+
+def _progress_upsert(update: ProgressUpdate):
+    """Filter and update document that create or update one (student, module) progress record atomically."""
+    new_record = ProgressRecord(**update.dict())
+    set_fields = {"completed": update.completed}
+    if update.score is not None:
+        set_fields["score"] = update.score
+    insert_only = {k: v for k, v in new_record.dict().items() if k not in set_fields}
+    return (
+        {"student_id": update.student_id, "module_id": update.module_id},
+        {"$set": set_fields, "$setOnInsert": insert_only},
+    )
 
 @api_router.post("/progress", response_model=ProgressRecord)
 async def update_progress(
@@ -266,59 +693,377 @@ async def update_progress(
     completed: bool = Body(...),
     score: Optional[float] = Body(None)
 ):
-    # Check if progress record exists
-    existing_record = await db.progress.find_one({
-        "student_id": student_id,
-        "module_id": module_id
-    })
-    
-    if existing_record:
-        # Update existing record
-        update_data = {"completed": completed}
-        if score is not None:
-            update_data["score"] = score
-        
-        await db.progress.update_one(
-            {"id": existing_record["id"]},
-            {"$set": update_data}
-        )
-        
-        # Get updated record
-        updated_record = await db.progress.find_one({"id": existing_record["id"]})
-        return ProgressRecord(**updated_record)
-    else:
-        # Create new progress record
-        progress_record = ProgressRecord(
-            student_id=student_id,
-            module_id=module_id,
-            module_name=module_name,
-            completed=completed,
-            score=score
-        )
-        await db.progress.insert_one(progress_record.dict())
-        return progress_record
+    record = await _record_progress(ProgressUpdate(
+        student_id=student_id,
+        module_id=module_id,
+        module_name=module_name,
+        completed=completed,
+        score=score
+    ))
+    return ProgressRecord(**record)
+
+async def _record_progress(update: ProgressUpdate) -> Dict[str, Any]:
+    query, changes = _progress_upsert(update)
+    # One round trip; the unique (student_id, module_id) index makes concurrent upserts safe.
+    # Two racing inserts make one of them fail with a duplicate key; retrying turns it into an update.
+    for attempt in range(2):
+        try:
+            record = await db.progress.find_one_and_update(
+                query, changes, projection={"_id": 0}, upsert=True, return_document=ReturnDocument.AFTER
+            )
+            student_modules.record_progress(record, module_catalog.graph)
+            return record
+        except DuplicateKeyError:
+            if attempt:
+                raise
+
+@api_router.post("/progress/batch", response_model=List[ProgressRecord])
+async def update_progress_batch(batch: ProgressBatch):
+    """Apply many module results (e.g. from an offline-synced tablet) in one bulk write."""
+    # Later results for the same (student, module) win, as if they had been posted one by one
+    latest = {(u.student_id, u.module_id): u for u in batch.updates}
+    operations = [UpdateOne(*_progress_upsert(u), upsert=True) for u in latest.values()]
+    try:
+        await db.progress.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Only duplicate-key races are expected here; retry those ops, which now hit the existing records
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != 11000 for error in errors):
+            raise
+        await db.progress.bulk_write([operations[error["index"]] for error in errors], ordered=False)
+
+    records = await db.progress.find(
+        {"$or": [{"student_id": s, "module_id": m} for s, m in latest]}, {"_id": 0}
+    ).to_list(len(latest))
+    for record in records:
+        student_modules.record_progress(record, module_catalog.graph)
+    return [ProgressRecord(**record) for record in records]
 
 @api_router.get("/progress/{student_id}", response_model=List[ProgressRecord])
 async def get_student_progress(student_id: str):
-    progress_records = await db.progress.find({"student_id": student_id}).to_list(100)
-    return [ProgressRecord(**record) for record in progress_records]
+    progress_records = await db.progress.find({"student_id": student_id}, progress_rows.projection).to_list(100)
+    return progress_rows.response(progress_records)
+
+@api_router.get("/students/{student_id}/modules", response_model=StudentModules)
+async def get_student_modules(student_id: str):
+    """The module catalog with `locked` worked out from this student's progress, plus that progress."""
+    catalog = await module_catalog.get(db)
+    state = student_modules.get(student_id, catalog.version)
+    if state is None:
+        records = await db.progress.find({"student_id": student_id}, {"_id": 0}).to_list(1000)
+        state = student_modules.build(student_id, catalog.version, catalog.graph, records)
+    return StudentModules(
+        student_id=student_id,
+        catalog_version=catalog.version,
+        modules=[{**module, "locked": state.locked.get(module["id"], True)} for module in catalog.modules],
+        progress=list(state.progress.values()),
+    )
+
+# Tutor sessions over WebSocket, per worker process
+WS_CHAT_MAX_CONNECTIONS = int(os.getenv("WS_CHAT_MAX_CONNECTIONS", 500))
+WS_CHAT_MAX_PENDING = int(os.getenv("WS_CHAT_MAX_PENDING", 2))
+WS_CHAT_SEND_TIMEOUT = float(os.getenv("WS_CHAT_SEND_TIMEOUT", 30))
+chat_sockets = {"open": 0, "refused": 0, "turns": 0}
+
+@api_router.websocket("/ws/chat/{student_id}")
+async def chat_socket(websocket: WebSocket, student_id: str):
+    """
+    A tutoring session on one connection. The student, their conversation window and
+    the tutor persona are loaded once when it opens; a turn then only stores its two
+    messages and streams the reply, and the window grows in memory.
+
+    Client frames: `{"type": "message", "content", "module_id"?}`, `{"type": "progress",
+    "module_id", "module_name", "completed", "score"?}` and `{"type": "ping"}`.
+    Server events: `ready`, `typing` (`typing: true` when the tutor starts on a message,
+    `false` when it is done), `token`, `done` (the full reply, as from /chat), `progress`
+    (the stored record), `pong` and `error` (`detail`, and `retry_after` when rate limited).
+
+    Messages are answered one at a time, in order. Up to WS_CHAT_MAX_PENDING may wait
+    behind the one being answered; more are refused with an error event. Tokens are
+    sent only as fast as the client reads them, and a client that reads nothing for
+    WS_CHAT_SEND_TIMEOUT seconds is disconnected.
+    """
+    if chat_sockets["open"] >= WS_CHAT_MAX_CONNECTIONS:
+        chat_sockets["refused"] += 1
+        await websocket.close(code=1013)  # Try again later
+        return
+    await websocket.accept()
+    chat_sockets["open"] += 1
+    sender = EventSender(websocket, WS_CHAT_SEND_TIMEOUT)
+    tasks: List[asyncio.Task] = []
+    try:
+        student, window = await asyncio.gather(
+            db.students.find_one({"id": student_id}, {"_id": 0}),
+            conversation_memory.load(student_id),
+        )
+        if not student:
+            await sender.send({"type": "error", "detail": "Student not found"})
+            await websocket.close(code=4404)
+            return
+        pending = TurnQueue(max_waiting=WS_CHAT_MAX_PENDING)
+        await sender.send({"type": "ready", "student_id": student_id, "history_turns": len(window.turns)})
+        tasks = [
+            asyncio.create_task(_read_socket_frames(websocket, sender, student_id, pending)),
+            asyncio.create_task(_answer_socket_turns(sender, student, _build_persona(student), window, pending)),
+        ]
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    except (WebSocketDisconnect, SlowClientError) as e:
+        logger.info(f"Chat socket for student {student_id} closed: {e.__class__.__name__}")
+        if isinstance(e, SlowClientError):
+            with suppress(Exception):
+                await asyncio.wait_for(websocket.close(code=1013), 1)
+    finally:
+        for task in tasks:
+            task.cancel()
+        chat_sockets["open"] -= 1
+
+async def _read_socket_frames(websocket: WebSocket, sender: EventSender, student_id: str, pending: TurnQueue) -> None:
+    while True:
+        received = await websocket.receive()
+        if received["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(received.get("code", 1000))
+        if received.get("text") is None:
+            await sender.send({"type": "error", "detail": "Frames must be text, not binary"})
+            continue
+        try:
+            frame = json.loads(received["text"])
+            kind = frame.get("type")
+        except (ValueError, AttributeError):
+            await sender.send({"type": "error", "detail": "Frames must be JSON objects with a type"})
+            continue
+        if kind == "message":
+            content = frame.get("content")
+            if not isinstance(content, str) or not content.strip():
+                await sender.send({"type": "error", "detail": "content must be a non-empty string"})
+            elif pending.full:
+                await sender.send({"type": "error", "detail": "Too many messages waiting for the tutor"})
+            elif rate_limiter and (wait := rate_limiter.check("chat", student_id)):
+                await sender.send({"type": "error", "detail": "Too many requests. Please slow down.",
+                                   "retry_after": max(1, math.ceil(wait))})
+            else:
+                pending.put((content, frame.get("module_id"), frame.get("standalone") is True))
+        elif kind == "progress":
+            try:
+                update = ProgressUpdate(**{**frame, "student_id": student_id})
+            except ValidationError as e:
+                await sender.send({"type": "error", "detail": jsonable_encoder(e.errors(include_url=False))})
+                continue
+            try:
+                record = await _record_progress(update)
+            except Exception as e:
+                logger.error(f"Error recording progress over chat socket: {str(e)}", exc_info=True)
+                await sender.send({"type": "error", "detail": "Could not save progress"})
+                continue
+            await sender.send({"type": "progress", "record": jsonable_encoder(ProgressRecord(**record))})
+        elif kind == "ping":
+            await sender.send({"type": "pong"})
+        else:
+            await sender.send({"type": "error", "detail": f"Unknown frame type: {kind}"})
+
+async def _answer_socket_turns(sender: EventSender, student: Dict[str, Any], persona: str, window: ConversationWindow,
+                               pending: TurnQueue) -> None:
+    while True:
+        message, module_id, standalone = await pending.get()
+        chat_sockets["turns"] += 1
+        await sender.send({"type": "typing", "typing": True})
+        new_turns: List[Dict[str, Any]] = []
+        try:
+            await _answer_socket_turn(sender, student, persona, window.to_gemini_history(), message, module_id,
+                                      standalone, new_turns)
+        except SlowClientError:
+            raise
+        except Exception as e:
+            logger.error(f"Error answering chat socket turn: {str(e)}", exc_info=True)
+            await sender.send({"type": "error", "detail": "The tutor could not finish this answer."})
+        finally:
+            # The window stays current without being loaded again
+            conversation_memory.extend(window, new_turns)
+            conversation_memory.schedule_fold(student["id"], window)
+            pending.done()
+        await sender.send({"type": "typing", "typing": False})
+
+async def _answer_socket_turn(sender: EventSender, student: Dict[str, Any], persona: str, history: List[Dict[str, Any]],
+                              message: str, module_id: Optional[str], standalone: bool,
+                              new_turns: List[Dict[str, Any]]) -> None:
+    """One chat turn, as /chat/stream does it, appending the messages it stores to `new_turns`."""
+    student_id = student["id"]
+    student_message = Message(student_id=student_id, content=message, role="student")
+    await _store_message(student_message)
+    new_turns.append(student_message.dict())
+
+    cache_scope = _answer_cache_scope(student, message, module_id, history, standalone)
+    reply = answer_cache.get(message, *cache_scope) if cache_scope else None
+    if reply is not None:
+        await sender.send({"type": "token", "token": reply})
+    else:
+        if cache_scope:
+            persona, history = _tutor_prompt(student, history, cache_scope)
+        parts = []
+        try:
+            async for token in llm.stream(persona, history, message):
+                parts.append(token)
+                await sender.send({"type": "token", "token": token})
+        except LLMOverloadedError as e:
+            logger.warning(f"Rejecting chat socket turn for student {student_id}: {e}")
+            await sender.send({"type": "error", "detail": _tutor_busy_error().detail, "retry_after": 5})
+            return
+        except LLMUnavailableError as e:
+            logger.warning(f"Tutor unavailable for student {student_id}: {e}")
+            if parts:
+                await sender.send({"type": "error", "detail": "The tutor could not finish this answer."})
+            else:
+                await sender.send({"type": "token", "token": TUTOR_FALLBACK_MESSAGE})
+                await sender.send({"type": "done", "response": TUTOR_FALLBACK_MESSAGE, "student_id": student_id,
+                                   "fallback": True})
+            return
+        reply = "".join(parts)
+        if cache_scope:
+            answer_cache.put(message, *cache_scope, reply)
+
+    tutor_message = Message(student_id=student_id, content=reply, role="tutor")
+    await _store_message(tutor_message)
+    new_turns.append(tutor_message.dict())
+    await sender.send({"type": "done", "response": reply, "student_id": student_id, "message_id": tutor_message.id})
 
 VIDEO_UPLOADS_DIR = ROOT_DIR / "video_uploads"
+VIDEO_CHUNK_MAX_BYTES = int(os.getenv("VIDEO_CHUNK_MAX_BYTES", 16 * 1024 * 1024))
+
+# One append-only file (plus an offset index) per recording session instead of a file per chunk
+video_store = SegmentStore(VIDEO_UPLOADS_DIR, max_chunk_bytes=VIDEO_CHUNK_MAX_BYTES)
+# Engagement signals (face present, motion, brightness) computed off the request path in worker processes
+engagement = EngagementPipeline(
+    db,
+    video_store,
+    workers=int(os.getenv("ENGAGEMENT_WORKERS", 2)),
+    queue_size=int(os.getenv("ENGAGEMENT_QUEUE_SIZE", 100)),
+    sample_every=int(os.getenv("ENGAGEMENT_SAMPLE_EVERY", 10)),
+    batch_size=int(os.getenv("ENGAGEMENT_BATCH_SIZE", 50)),
+    flush_interval=float(os.getenv("ENGAGEMENT_FLUSH_INTERVAL", 5)),
+) if os.getenv("ENGAGEMENT_ANALYSIS_ENABLED", "false").lower() == "true" else None
+video_sessions = VideoSessionManager(
+    db,
+    video_store,
+    idle_timeout=float(os.getenv("VIDEO_SESSION_IDLE_TIMEOUT", 600)),
+    raw_retention=float(os.getenv("VIDEO_RAW_RETENTION", 3600)),
+    retention_days=float(os.getenv("VIDEO_RETENTION_DAYS", 30)),
+    on_chunk=engagement.submit if engagement else None,
+)
+VIDEO_COMPACTION_INTERVAL = float(os.getenv("VIDEO_COMPACTION_INTERVAL", 600))
+
+async def _store_video_chunk(
+    student_id: str, session_id: Optional[str], mime_type: Optional[str], pieces: AsyncIterator[bytes],
+    seq: Optional[int] = None, create: bool = True
+) -> Dict[str, Any]:
+    """
+    Append a chunk to one of the student's sessions. Without a session id the chunk goes to the
+    recording it belongs to (see VideoSessionManager.implicit_session); with `create=False` the
+    session must have been started.
+    """
+    try:
+        if session_id is None:
+            session_id, pieces = await video_sessions.implicit_session(student_id, pieces, mime_type)
+        entry = await video_sessions.add_chunk(student_id, session_id, pieces, seq=seq, mime_type=mime_type,
+                                               create=create)
+    except DuplicateChunkError:
+        # A retry of a chunk we already have; acknowledge it so the client moves on
+        return {"session_id": session_id, "seq": seq, "duplicate": True}
+    except VideoSessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except VideoSessionClosedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ChunkTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if metrics:
+        metrics.video_chunks.inc()
+        metrics.video_bytes.inc(entry.length)
+    return {"session_id": session_id, "seq": entry.seq, "offset": entry.offset, "size_bytes": entry.length}
+
+def _check_chunk_length(content_length: Optional[int]) -> None:
+    if content_length == 0:
+        raise HTTPException(status_code=400, detail="Empty video chunk")
+    if content_length is not None and content_length > VIDEO_CHUNK_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Video chunk larger than {VIDEO_CHUNK_MAX_BYTES} bytes")
+
+@api_router.post("/video/sessions", response_model=Dict[str, Any])
+async def start_video_session(student_id: str = Body(...), mime_type: Optional[str] = Body("video/webm")):
+    """Start a recording session; its chunks go to POST /api/video/sessions/{session_id}/chunks?seq=N."""
+    _enforce_rate_limit("video", student_id)
+    try:
+        return await video_sessions.start(student_id, mime_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.post("/video/sessions/{session_id}/chunks", response_model=Dict[str, Any])
+async def upload_video_session_chunk(
+    session_id: str,
+    request: Request,
+    student_id: str = Query(...),
+    seq: int = Query(..., ge=0),
+    content_type: Optional[str] = Header(default=None),
+    content_length: Optional[int] = Header(default=None)
+):
+    """
+    Store chunk number `seq` of a started session, sent as the raw request body.
+    Chunks may arrive out of order; a `seq` that is already stored is acknowledged with `duplicate: true`.
+    """
+    _check_chunk_length(content_length)
+    _enforce_rate_limit("video", student_id)
+    chunk = await _store_video_chunk(student_id, session_id, content_type, request.stream(), seq=seq, create=False)
+    return {"status": "success", **chunk}
+
+@api_router.post("/video/sessions/{session_id}/stop", response_model=Dict[str, Any])
+async def stop_video_session(session_id: str, student_id: str = Query(...)):
+    """Stop recording; the chunks are reassembled in sequence order into one file in the background."""
+    try:
+        return await video_sessions.stop(student_id, session_id)
+    except VideoSessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@api_router.get("/video/sessions/{session_id}", response_model=Dict[str, Any])
+async def get_video_session(session_id: str, student_id: str = Query(...)):
+    try:
+        return await video_sessions.get(student_id, session_id)
+    except VideoSessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Video session not found")
+
+@api_router.post("/video/chunks", response_model=Dict[str, Any])
+async def upload_video_chunk(
+    request: Request,
+    student_id: str = Query(...),
+    session_id: Optional[str] = Query(default=None),
+    content_type: Optional[str] = Header(default=None),
+    content_length: Optional[int] = Header(default=None)
+):
+    """
+    Store one MediaRecorder chunk sent as the raw request body (Content-Type is the chunk's MIME type).
+    The body is streamed to disk as it arrives; it is never base64-encoded or held in memory whole.
+    """
+    _check_chunk_length(content_length)
+    _enforce_rate_limit("video", student_id)
+    chunk = await _store_video_chunk(student_id, session_id, content_type or "video/webm", request.stream())
+    return {
+        "status": "success",
+        "chunk_id": f"{chunk['session_id']}:{chunk['seq']}",
+        **chunk
+    }
+
+async def _single_piece(data: bytes) -> AsyncIterator[bytes]:
+    yield data
 
 @api_router.post("/process-video-frame", response_model=Dict[str, Any])
 async def process_video_frame(video_frame_input: VideoFrame):
     """
     Process a video/audio frame chunk from the student's camera.
     Saves the chunk to a file.
+    Kept for older clients; POST /api/video/chunks takes the chunk as raw bytes instead of base64 JSON.
     """
+    _enforce_rate_limit("video", video_frame_input.student_id)
     try:
-        student_id = video_frame_input.student_id
         base64_data = video_frame_input.frame_data
-        mime_type = video_frame_input.mime_type
-
-        # Ensure student-specific directory exists
-        student_video_dir = VIDEO_UPLOADS_DIR / student_id
-        student_video_dir.mkdir(parents=True, exist_ok=True)
 
         # Remove the data URL prefix if present (e.g., "data:video/webm;base64,")
         if "," in base64_data:
@@ -328,41 +1073,18 @@ async def process_video_frame(video_frame_input: VideoFrame):
             
         # Decode base64 to binary data
         binary_data = base64.b64decode(actual_base64_data)
-
-        # Generate a unique filename for the chunk
-        timestamp_str = datetime.utcnow().strftime("%Y%m%d_%H%M%S_%f")
-        file_extension = mime_type.split("/")[-1] if mime_type else "webm"
-        # Sanitize file extension if necessary, e.g., remove codecs part for ; codecs=vp8,opus
-        if ";" in file_extension:
-            file_extension = file_extension.split(";")[0]
-
-        chunk_filename = f"{timestamp_str}.{file_extension}"
-        chunk_filepath = student_video_dir / chunk_filename
-
-        # Write the binary data to the file
-        with open(chunk_filepath, "wb") as f:
-            f.write(binary_data)
-
-        # Log to database (optional, can be adapted)
-        # The old frame_record was for images and stored in db.video_frames
-        # For video chunks, you might want a different collection or structure
-        video_chunk_record = {
-            "id": str(uuid.uuid4()),
-            "student_id": student_id,
-            "timestamp": datetime.utcnow(),
-            "mime_type": mime_type,
-            "filepath": str(chunk_filepath), # Store relative or absolute path
-            "filename": chunk_filename,
-            "size_bytes": len(binary_data)
-        }
-        await db.video_chunks.insert_one(video_chunk_record) # Using a new collection "video_chunks"
+        chunk = await _store_video_chunk(
+            video_frame_input.student_id, None, video_frame_input.mime_type, _single_piece(binary_data)
+        )
 
         return {
             "status": "success",
             "message": "Video chunk processed and saved successfully",
-            "chunk_id": video_chunk_record["id"],
-            "filename": chunk_filename
+            "chunk_id": f"{chunk['session_id']}:{chunk['seq']}",
+            "filename": video_store.paths(video_frame_input.student_id, chunk["session_id"])[0].name
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing video frame: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -370,13 +1092,160 @@ async def process_video_frame(video_frame_input: VideoFrame):
             detail=f"Error processing video frame: {str(e)}"
         )
 
+# Admin endpoints take this token in X-Admin-Token; without one configured they are off
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_MAX_SECONDS = 60
+
+stack_sampler = StackSampler(interval=float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.01)))
+
+def _require_admin(token: Optional[str]) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if not token or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@api_router.get("/admin/profile")
+async def profile_worker(
+    seconds: float = Query(default=10, gt=0, le=PROFILE_MAX_SECONDS),
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """
+    Sample this worker's Python stacks for `seconds` and return them in collapsed
+    (flamegraph.pl / speedscope) format. Requests keep being served while it runs.
+    """
+    _require_admin(x_admin_token)
+    try:
+        counts = await asyncio.to_thread(stack_sampler.sample, seconds)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(collapsed(counts), media_type="text/plain")
+
+@api_router.get("/admission-stats", response_model=Dict[str, Any])
+async def get_admission_stats():
+    """Rate limiter and in-flight cap counters."""
+    return {
+        "rate_limits": rate_limiter.stats if rate_limiter else None,
+        "in_flight": in_flight_limiter.stats if in_flight_limiter else None,
+    }
+
 # Include the router in the main app
 app.include_router(api_router)
 
+READY_CHECK_TIMEOUT = float(os.getenv("READY_CHECK_TIMEOUT", 2))
+
+def _check_error(e: Exception) -> str:
+    return f"error: {type(e).__name__}: {e}" if str(e) else f"error: {type(e).__name__}"
+
+def _startup_check() -> str:
+    for task in startup_tasks:
+        if not task.done():
+            return "pending"
+        if not task.cancelled() and task.exception():
+            return _check_error(task.exception())
+    return "ok"
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: the process is up and its event loop is answering. Touches no dependencies."""
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness: MongoDB answers a ping, the LLM provider is configured and startup work is done."""
+    checks = {}
+    try:
+        await db.ping(READY_CHECK_TIMEOUT)
+        checks["mongo"] = "ok"
+    except Exception as e:
+        checks["mongo"] = _check_error(e)
+    try:
+        await asyncio.wait_for(asyncio.to_thread(llm.provider.load), READY_CHECK_TIMEOUT)
+        checks["llm"] = "ok"
+    except Exception as e:
+        checks["llm"] = _check_error(e)
+    checks["startup"] = _startup_check()
+    ready = all(value == "ok" for value in checks.values())
+    return JSONResponse({"status": "ready" if ready else "not ready", "checks": checks}, status_code=200 if ready else 503)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus text exposition of the metrics below."""
+    if metrics is None:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+def _cache_lookups() -> Dict[tuple, int]:
+    lookups = {
+        ("module_catalog", "hit"): module_catalog.hits,
+        ("module_catalog", "miss"): module_catalog.loads,
+        ("student_modules", "hit"): student_modules.hits,
+        ("student_modules", "miss"): student_modules.misses,
+        # Duplicate chat requests answered from a running or just-finished turn
+        ("chat_requests", "coalesced"): chat_requests.coalesced,
+        ("chat_requests", "replayed"): chat_requests.replayed,
+        ("chat_requests", "miss"): chat_requests.leaders,
+    }
+    if answer_cache:
+        lookups.update({
+            ("answer_cache", "hit"): answer_cache.hits,
+            ("answer_cache", "near_hit"): answer_cache.near_hits,
+            ("answer_cache", "miss"): answer_cache.misses,
+            ("answer_cache", "bypass"): answer_cache.bypassed,
+        })
+    return lookups
+
+def _rate_limited() -> Dict[tuple, int]:
+    limited = {}
+    for route_class, counters in (rate_limiter.counters if rate_limiter else {}).items():
+        limited[(route_class, "student")] = counters["limited_student"]
+        limited[(route_class, "global")] = counters["limited_global"]
+    return limited
+
+# Counters kept by the subsystems themselves are read when /metrics is scraped, not on every request
+if metrics:
+    metrics.callback("cache_lookups_total", "Cache lookups by cache and result", _cache_lookups,
+                     kind="counter", labelnames=("cache", "result"))
+    metrics.callback("llm_calls", "LLM calls running on the executor or waiting for a slot",
+                     lambda: {("running",): llm_executor.stats["running"], ("waiting",): llm_executor.stats["waiting"]},
+                     labelnames=("state",))
+    metrics.callback("llm_circuit_open", "1 while the LLM circuit breaker is open or half-open",
+                     lambda: int(llm.breaker.state != "closed"))
+    metrics.callback("rate_limited_total", "Requests refused with 429 by route class and bucket", _rate_limited,
+                     kind="counter", labelnames=("route_class", "bucket"))
+    metrics.callback("overload_rejections_total", "Requests refused with 503 by the in-flight cap",
+                     lambda: in_flight_limiter.rejected if in_flight_limiter else None, kind="counter")
+    metrics.callback("message_buffer_pending", "Chat messages waiting for the write-behind flush",
+                     lambda: message_buffer.stats["pending"] if message_buffer else None)
+    metrics.callback("engagement_jobs_total", "Engagement analysis jobs by outcome",
+                     lambda: {(k,): engagement.stats[k] for k in ("submitted", "shed", "analyzed", "failed")} if engagement else None,
+                     kind="counter", labelnames=("outcome",))
+    metrics.callback("engagement_queue_depth", "Chunks waiting for engagement analysis",
+                     lambda: engagement.stats["queued"] if engagement else None)
+    metrics.callback("chat_sockets_open", "Open tutor WebSocket sessions", lambda: chat_sockets["open"])
+    metrics.callback("chat_socket_turns_total", "Chat turns answered over WebSocket sessions",
+                     lambda: chat_sockets["turns"], kind="counter")
+    metrics.callback("chat_sockets_refused_total", "WebSocket sessions refused by WS_CHAT_MAX_CONNECTIONS",
+                     lambda: chat_sockets["refused"], kind="counter")
+
+# Past this many concurrent requests, answer 503 at once rather than let every request slow down.
+# Added before CORS so the 503s still carry CORS headers.
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", 256))
+in_flight_limiter = InFlightLimiter(max_in_flight=MAX_IN_FLIGHT) if MAX_IN_FLIGHT > 0 else None
+if in_flight_limiter:
+    app.add_middleware(InFlightMiddleware, limiter=in_flight_limiter, exempt_paths=("/healthz", "/readyz", "/metrics"))
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor", "Server-Timing"],
 )
+
+if SERVER_TIMING_ENABLED:
+    app.add_middleware(ServerTimingMiddleware)
+
+# Outermost, so requests refused by the in-flight cap are counted too
+if metrics:
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Coalesces duplicate work by key.
+
+    While a call for a key is running, identical calls await the same future instead
+    of starting their own. After it succeeds, the result is kept for `replay_window`
+    seconds so retries get it back without redoing the work. Failures are not kept.
+
+    Followers wait at most `follower_timeout` seconds. A key still in flight after
+    that long is presumed abandoned by its leader, and the next caller takes it over.
+    """
+
+    def __init__(self, replay_window: float = 10.0, max_results: int = 10000, follower_timeout: float = 120.0):
+        self.replay_window = replay_window
+        self.max_results = max_results
+        self.follower_timeout = follower_timeout
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._started: Dict[Hashable, float] = {}
+        self._results: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.leaders = 0
+        self.coalesced = 0
+        self.replayed = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "stored": len(self._results),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "replayed": self.replayed,
+        }
+
+    def begin(self, key: Hashable) -> Tuple[bool, asyncio.Future]:
+        """
+        Claim `key`. Returns (True, future) if the caller must do the work and then call
+        finish() or fail(); otherwise (False, future) resolving to the shared result.
+        """
+        self._evict_expired()
+        loop = asyncio.get_running_loop()
+        stored = self._results.get(key)
+        if stored is not None:
+            self.replayed += 1
+            future = loop.create_future()
+            future.set_result(stored[1])
+            return False, future
+        future = self._inflight.get(key)
+        if future is not None:
+            if time.monotonic() - self._started[key] < self.follower_timeout:
+                self.coalesced += 1
+                return False, future
+            self.fail(key, asyncio.TimeoutError(f"Leader for {key!r} never finished"))
+        future = loop.create_future()
+        # Followers may all go away; don't warn about an exception nobody retrieved
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        self._started[key] = time.monotonic()
+        self.leaders += 1
+        return True, future
+
+    def finish(self, key: Hashable, result: Any) -> None:
+        future = self._inflight.pop(key, None)
+        self._started.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+        self._results[key] = (time.monotonic() + self.replay_window, result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+
+    def fail(self, key: Hashable, error: BaseException) -> None:
+        future = self._inflight.pop(key, None)
+        self._started.pop(key, None)
+        if future is None or future.done():
+            return
+        if isinstance(error, asyncio.CancelledError):
+            future.cancel()
+        else:
+            future.set_exception(error)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `fn()` once per key; duplicates share the outcome even if the first caller disconnects."""
+        leader, future = self.begin(key)
+        if leader:
+            task = asyncio.create_task(fn())
+
+            def settle(t: asyncio.Task) -> None:
+                if t.cancelled():
+                    self.fail(key, asyncio.CancelledError())
+                elif t.exception() is not None:
+                    self.fail(key, t.exception())
+                else:
+                    self.finish(key, t.result())
+
+            task.add_done_callback(settle)
+            return await asyncio.shield(future)
+        return await self.wait(future)
+
+    async def wait(self, future: asyncio.Future) -> Any:
+        """A follower's share of the outcome; asyncio.TimeoutError after `follower_timeout` seconds."""
+        return await asyncio.wait_for(asyncio.shield(future), self.follower_timeout)
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        while self._results:
+            key, (expires_at, _) = next(iter(self._results.items()))
+            if expires_at > now:
+                break
+            self._results.popitem(last=False)
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from video_store import SegmentEntry, SegmentStore
+
+logger = logging.getLogger(__name__)
+
+RECORDING = "recording"
+FINALIZING = "finalizing"
+FINALIZED = "finalized"
+
+# Cap on how many missing sequence numbers are written to a session record
+_MAX_MISSING_LISTED = 100
+
+
+class VideoSessionNotFoundError(Exception):
+    pass
+
+
+class VideoSessionClosedError(Exception):
+    pass
+
+
+def extension_for(mime_type: Optional[str]) -> str:
+    # "video/webm; codecs=vp8,opus" -> "webm"
+    return (mime_type or "video/webm").split("/")[-1].split(";")[0].strip() or "webm"
+
+
+def starts_recording(head: bytes) -> bool:
+    """True for the first chunk of a MediaRecorder run: a WebM (EBML) header or an MP4 `ftyp` box."""
+    return head[:4] == b"\x1a\x45\xdf\xa3" or head[4:8] == b"ftyp"
+
+
+async def _peek(pieces: AsyncIterator[bytes], size: int = 8) -> Tuple[bytes, AsyncIterator[bytes]]:
+    """The first `size` bytes of a streamed body, and an iterator over the whole body."""
+    iterator = pieces.__aiter__()
+    buffered: List[bytes] = []
+    while sum(len(piece) for piece in buffered) < size:
+        try:
+            buffered.append(await iterator.__anext__())
+        except StopAsyncIteration:
+            break
+
+    async def replay() -> AsyncIterator[bytes]:
+        for piece in buffered:
+            yield piece
+        async for piece in iterator:
+            yield piece
+
+    return b"".join(buffered)[:size], replay()
+
+
+class VideoSessionManager:
+    """
+    Lifecycle of recording sessions kept in `db.video_sessions` and a SegmentStore.
+
+    A session is started, receives numbered chunks (retries of a stored number are
+    ignored), and is finalized when stopped or after `idle_timeout` seconds without a
+    chunk: its chunks are reassembled in sequence order into one file. `compact()`
+    deletes raw chunk files `raw_retention` seconds after finalization and whole
+    sessions (files and records) older than `retention_days`; `run_compaction` calls
+    it periodically from the app's lifespan. `on_chunk(student_id, session_id, entry)`
+    is called after every stored chunk, e.g. to queue it for analysis.
+
+    Sessions belong to a student: every lookup is by (student_id, session_id), so
+    one student can never add to, stop or read another's session.
+    """
+
+    def __init__(self, db, store: SegmentStore, idle_timeout: float = 600.0, raw_retention: float = 3600.0,
+                 retention_days: float = 30.0,
+                 on_chunk: Optional[Callable[[str, str, SegmentEntry], Any]] = None):
+        self.db = db
+        self.store = store
+        self.on_chunk = on_chunk
+        self.idle_timeout = idle_timeout
+        self.raw_retention = raw_retention
+        self.retention_days = retention_days
+        self._finalizing: Set[asyncio.Task] = set()
+
+    async def start(self, student_id: str, mime_type: Optional[str] = None, implicit: bool = False) -> Dict[str, Any]:
+        session_id = str(uuid.uuid4())
+        self.store.paths(student_id, session_id)  # validates the student id before anything is stored
+        now = datetime.utcnow()
+        session = {
+            "id": session_id,
+            "session_id": session_id,
+            "student_id": student_id,
+            "mime_type": mime_type or "video/webm",
+            "status": RECORDING,
+            "chunk_count": 0,
+            "size_bytes": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        if implicit:
+            session["implicit"] = True
+        await self.db.video_sessions.insert_one(dict(session))
+        return session
+
+    async def implicit_session(self, student_id: str, pieces: AsyncIterator[bytes],
+                               mime_type: Optional[str] = None) -> Tuple[str, AsyncIterator[bytes]]:
+        """
+        The session for a chunk uploaded without one, and the chunk to pass on to `add_chunk`.
+
+        Each MediaRecorder run gets its own session: a chunk that starts a recording (it
+        carries the container header) stops the student's previous implicit session and
+        starts a new one, so an assembled file never holds a second header mid-stream.
+        Other chunks go to the student's latest implicit session that is still recording.
+        """
+        head, pieces = await _peek(pieces)
+        query = {"student_id": student_id, "implicit": True, "status": RECORDING}
+        if starts_recording(head):
+            async for session in self.db.video_sessions.find(query, {"_id": 0, "session_id": 1}):
+                await self.stop(student_id, session["session_id"])
+            current = None
+        else:
+            current = await self.db.video_sessions.find_one(
+                query, {"_id": 0, "session_id": 1}, sort=[("created_at", -1)]
+            )
+        if current is None:
+            current = await self.start(student_id, mime_type, implicit=True)
+        return current["session_id"], pieces
+
+    async def add_chunk(self, student_id: str, session_id: str, pieces: AsyncIterator[bytes], seq: Optional[int] = None,
+                        mime_type: Optional[str] = None, create: bool = False) -> SegmentEntry:
+        """
+        Append one chunk to a session of `student_id`. The session must have been started,
+        unless `create` is set: then an unknown session id is created on the fly (uploads
+        that name their own session without calling start).
+        Raises DuplicateChunkError for a `seq` that is already stored.
+        """
+        session = await self.db.video_sessions.find_one(
+            {"student_id": student_id, "session_id": session_id}, {"_id": 0, "status": 1}
+        )
+        if session is None and not create:
+            raise VideoSessionNotFoundError(f"Video session {session_id} not found")
+        if session is not None and session.get("status", RECORDING) != RECORDING:
+            raise VideoSessionClosedError(f"Video session {session_id} is {session['status']}")
+
+        entry = await self.store.append(student_id, session_id, pieces, seq=seq)
+        now = datetime.utcnow()
+        await self.db.video_sessions.update_one(
+            {"student_id": student_id, "session_id": session_id},
+            {
+                "$setOnInsert": {
+                    "id": str(uuid.uuid4()), "mime_type": mime_type, "status": RECORDING, "created_at": now,
+                },
+                "$set": {"updated_at": now},
+                "$inc": {"chunk_count": 1, "size_bytes": entry.length},
+            },
+            upsert=True,
+        )
+        if self.on_chunk is not None:
+            self.on_chunk(student_id, session_id, entry)
+        return entry
+
+    async def get(self, student_id: str, session_id: str) -> Dict[str, Any]:
+        session = await self.db.video_sessions.find_one({"student_id": student_id, "session_id": session_id}, {"_id": 0})
+        if session is None:
+            raise VideoSessionNotFoundError(f"Video session {session_id} not found")
+        return session
+
+    async def stop(self, student_id: str, session_id: str) -> Dict[str, Any]:
+        """Close a recording session and assemble it in the background."""
+        session = await self.db.video_sessions.find_one_and_update(
+            {"student_id": student_id, "session_id": session_id, "status": {"$in": [RECORDING, None]}},
+            {"$set": {"status": FINALIZING, "updated_at": datetime.utcnow()}},
+            projection={"_id": 0},
+        )
+        if session is None:
+            return await self.get(student_id, session_id)  # already stopped; stopping twice is fine
+        self._finalize_in_background(session)
+        return {**session, "status": FINALIZING}
+
+    def _finalize_in_background(self, session: Dict[str, Any]) -> None:
+        task = asyncio.create_task(self.finalize(session))
+        self._finalizing.add(task)
+        task.add_done_callback(self._finalizing.discard)
+
+    async def finalize(self, session: Dict[str, Any]) -> None:
+        student_id, session_id = session["student_id"], session["session_id"]
+        try:
+            path, size, missing = await self.store.assemble(student_id, session_id, extension_for(session.get("mime_type")))
+        except Exception as e:
+            # Left as finalizing; compaction retries it once it has been idle long enough
+            logger.error(f"Could not assemble video session {session_id}: {e}", exc_info=True)
+            return
+        now = datetime.utcnow()
+        await self.db.video_sessions.update_one(
+            {"student_id": student_id, "session_id": session_id},
+            {"$set": {
+                "status": FINALIZED,
+                "finalized_at": now,
+                "updated_at": now,
+                "final_file": path.name,
+                "final_size_bytes": size,
+                "missing_seqs": missing[:_MAX_MISSING_LISTED],
+                "missing_count": len(missing),
+            }},
+        )
+        if missing:
+            logger.warning(f"Video session {session_id} finalized with {len(missing)} missing chunks")
+        if self.raw_retention <= 0:
+            await self.store.delete_raw(student_id, session_id)
+            await self.db.video_sessions.update_one(
+                {"student_id": student_id, "session_id": session_id}, {"$set": {"raw_deleted": True}}
+            )
+
+    async def compact(self) -> Dict[str, int]:
+        """One pass of the finalize / raw cleanup / retention policy. Returns counts per action."""
+        now = datetime.utcnow()
+        counts = {"finalized": 0, "raw_deleted": 0, "expired": 0, "legacy_chunks_deleted": 0}
+
+        # Sessions nobody stopped (closed tab, lost network), and finalizations that never finished
+        idle_before = now - timedelta(seconds=self.idle_timeout)
+        stale = await self.db.video_sessions.find(
+            {"status": {"$in": [RECORDING, FINALIZING, None]}, "updated_at": {"$lt": idle_before}},
+            {"_id": 0},
+        ).to_list(None)
+        for session in stale:
+            claimed = await self.db.video_sessions.find_one_and_update(
+                {"student_id": session["student_id"], "session_id": session["session_id"],
+                 "updated_at": session["updated_at"]},
+                {"$set": {"status": FINALIZING, "updated_at": now}},
+            )
+            if claimed is not None:  # otherwise another worker got it, or a chunk just arrived
+                await self.finalize(session)
+                counts["finalized"] += 1
+
+        if self.raw_retention > 0:
+            finalized = await self.db.video_sessions.find(
+                {"status": FINALIZED, "raw_deleted": {"$ne": True},
+                 "finalized_at": {"$lt": now - timedelta(seconds=self.raw_retention)}},
+                {"_id": 0, "student_id": 1, "session_id": 1},
+            ).to_list(None)
+            for session in finalized:
+                await self.store.delete_raw(session["student_id"], session["session_id"])
+                await self.db.video_sessions.update_one(
+                    {"student_id": session["student_id"], "session_id": session["session_id"]},
+                    {"$set": {"raw_deleted": True}},
+                )
+                counts["raw_deleted"] += 1
+
+        if self.retention_days > 0:
+            expire_before = now - timedelta(days=self.retention_days)
+            expired = await self.db.video_sessions.find(
+                {"created_at": {"$lt": expire_before}},
+                {"_id": 0, "student_id": 1, "session_id": 1, "mime_type": 1},
+            ).to_list(None)
+            for session in expired:
+                await self.store.delete(session["student_id"], session["session_id"], extension_for(session.get("mime_type")))
+                await self.db.video_sessions.delete_one(
+                    {"student_id": session["student_id"], "session_id": session["session_id"]}
+                )
+                counts["expired"] += 1
+            # One file per chunk, as written before session storage existed
+            legacy = await self.db.video_chunks.find(
+                {"timestamp": {"$lt": expire_before}}, {"_id": 0, "id": 1, "filepath": 1}
+            ).to_list(None)
+            if legacy:
+                await asyncio.to_thread(self._unlink_legacy, [chunk.get("filepath") for chunk in legacy])
+                result = await self.db.video_chunks.delete_many({"id": {"$in": [chunk["id"] for chunk in legacy]}})
+                counts["legacy_chunks_deleted"] = result.deleted_count
+
+        if any(counts.values()):
+            logger.info(f"Video compaction: {counts}")
+        return counts
+
+    def _unlink_legacy(self, filepaths) -> None:
+        root = self.store.root.resolve()
+        for filepath in filepaths:
+            if not filepath:
+                continue
+            path = Path(filepath).resolve()
+            if root in path.parents:
+                path.unlink(missing_ok=True)
+
+    async def run_compaction(self, interval: float) -> None:
+        while True:
+            try:
+                await self.compact()
+            except Exception as e:
+                logger.error(f"Video compaction failed: {e}", exc_info=True)
+            await asyncio.sleep(interval)
+
+    async def wait_for_finalizing(self) -> None:
+        if self._finalizing:
+            await asyncio.gather(*self._finalizing, return_exceptions=True)
@@ -0,0 +1,260 @@
+import asyncio
+import mmap
+import os
+import re
+import struct
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import AsyncIterator, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within one process
+    fcntl = None
+
+# One index record per chunk: sequence number, byte offset, byte length, receive time (unix ms)
+_INDEX_RECORD = struct.Struct("<qQIq")
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+
+
+class ChunkTooLargeError(ValueError):
+    pass
+
+
+class DuplicateChunkError(Exception):
+    """A chunk with this sequence number is already stored (e.g. a client retry)."""
+
+    def __init__(self, seq: int):
+        super().__init__(f"Chunk {seq} already stored")
+        self.seq = seq
+
+
+class SegmentEntry(NamedTuple):
+    seq: int
+    offset: int
+    length: int
+    received_at_ms: int
+
+
+def _check_id(value: str, what: str) -> str:
+    if not _SAFE_ID.match(value) or value in (".", ".."):
+        raise ValueError(f"Invalid {what}: {value!r}")
+    return value
+
+
+class SegmentStore:
+    """
+    Append-only video storage: one data file per recording session plus a compact index.
+
+    Chunks of a session are appended to `<root>/<student_id>/<session_id>.seg` and each
+    gets a fixed-size record (seq, offset, length, time) in `<session_id>.idx`, so a
+    session can be range-read or memory-mapped instead of opening a file per chunk.
+    All file I/O runs on worker threads. Appends to one session are serialized, across
+    worker processes too (an exclusive flock on the data file); the index is written
+    after the data, and anything in the data file past the last indexed chunk (a
+    crashed or rejected upload) is truncated on the next append.
+    """
+
+    def __init__(self, root: Path, max_chunk_bytes: int = 16 * 1024 * 1024, max_tracked_sessions: int = 1024):
+        self.root = Path(root)
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_tracked_sessions = max_tracked_sessions
+        self._locks: "weakref.WeakValueDictionary[Tuple[str, str], asyncio.Lock]" = weakref.WeakValueDictionary()
+        # Sequence numbers already stored, per recently used session, for duplicate detection,
+        # with the number of index records they cover (other processes may have added more)
+        self._seqs: "OrderedDict[Tuple[str, str], Tuple[Set[int], int]]" = OrderedDict()
+
+    def paths(self, student_id: str, session_id: str) -> Tuple[Path, Path]:
+        directory = self.root / _check_id(student_id, "student id")
+        name = _check_id(session_id, "session id")
+        return directory / f"{name}.seg", directory / f"{name}.idx"
+
+    def final_path(self, student_id: str, session_id: str, extension: str = "webm") -> Path:
+        return self.paths(student_id, session_id)[0].with_suffix(f".{extension}")
+
+    def _lock(self, student_id: str, session_id: str) -> asyncio.Lock:
+        key = (student_id, session_id)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+    async def append(self, student_id: str, session_id: str, pieces: AsyncIterator[bytes],
+                     seq: Optional[int] = None) -> SegmentEntry:
+        """
+        Stream one chunk onto the end of a session. `seq` defaults to the chunk's position
+        in the session. Raises ChunkTooLargeError past `max_chunk_bytes`, and
+        DuplicateChunkError if an explicit `seq` is already stored; either way the
+        session is left as it was.
+        """
+        data_path, index_path = self.paths(student_id, session_id)
+        key = (student_id, session_id)
+        async with self._lock(student_id, session_id):
+            f, offset, count = await asyncio.to_thread(self._begin_append, data_path, index_path)
+            length = 0
+            try:
+                if seq is not None and seq in await self._stored_seqs(key, index_path, count):
+                    raise DuplicateChunkError(seq)
+                async for piece in pieces:
+                    length += len(piece)
+                    if length > self.max_chunk_bytes:
+                        raise ChunkTooLargeError(f"Video chunk larger than {self.max_chunk_bytes} bytes")
+                    await asyncio.to_thread(f.write, piece)
+                entry = SegmentEntry(count if seq is None else seq, offset, length, int(time.time() * 1000))
+                await asyncio.to_thread(self._commit, f, index_path, entry)
+                if key in self._seqs:
+                    seqs, _ = self._seqs[key]
+                    seqs.add(entry.seq)
+                    self._seqs[key] = (seqs, count + 1)
+                return entry
+            except BaseException:
+                await asyncio.to_thread(self._rollback, f, offset)
+                raise
+
+    async def _stored_seqs(self, key: Tuple[str, str], index_path: Path, count: int) -> Set[int]:
+        """Sequence numbers among the first `count` index records; only records not seen yet are read."""
+        seqs, known = self._seqs.get(key, (set(), 0))
+        if known > count:  # the index was rewritten (session deleted and restarted)
+            seqs, known = set(), 0
+        if known < count:
+            seqs = seqs | {entry.seq for entry in await asyncio.to_thread(self._read_index, index_path, known, count)}
+        self._seqs[key] = (seqs, count)
+        self._seqs.move_to_end(key)
+        while len(self._seqs) > self.max_tracked_sessions:
+            self._seqs.popitem(last=False)
+        return seqs
+
+    @staticmethod
+    def _begin_append(data_path: Path, index_path: Path):
+        try:
+            fd = os.open(data_path, os.O_RDWR | os.O_CREAT, 0o644)
+        except FileNotFoundError:
+            data_path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(data_path, os.O_RDWR | os.O_CREAT, 0o644)
+        f = os.fdopen(fd, "r+b")
+        if fcntl is not None:
+            # Other worker processes may append to the same session; held until the file is closed
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        end = 0
+        try:
+            index_size = index_path.stat().st_size
+        except FileNotFoundError:
+            index_size = 0
+        count = index_size // _INDEX_RECORD.size
+        if count:
+            with open(index_path, "rb") as index:
+                index.seek((count - 1) * _INDEX_RECORD.size)
+                last = SegmentEntry(*_INDEX_RECORD.unpack(index.read(_INDEX_RECORD.size)))
+            end = last.offset + last.length
+        if os.fstat(f.fileno()).st_size != end:
+            f.truncate(end)
+        f.seek(end)
+        return f, end, count
+
+    @staticmethod
+    def _commit(f, index_path: Path, entry: SegmentEntry) -> None:
+        try:
+            # Data before its index record; the record is written while the session is still locked
+            f.flush()
+            with open(index_path, "ab") as index:
+                # Drop a torn record left by a crash mid-write before appending
+                size = index.tell()
+                if size % _INDEX_RECORD.size:
+                    index.truncate(size - size % _INDEX_RECORD.size)
+                index.write(_INDEX_RECORD.pack(*entry))
+        finally:
+            f.close()
+
+    @staticmethod
+    def _rollback(f, offset: int) -> None:
+        try:
+            f.truncate(offset)
+        finally:
+            f.close()
+
+    def _read_index(self, index_path: Path, start: int = 0, stop: Optional[int] = None) -> List[SegmentEntry]:
+        """Index records `start` up to `stop` (default: all of them)."""
+        try:
+            with open(index_path, "rb") as index:
+                index.seek(start * _INDEX_RECORD.size)
+                raw = index.read(-1 if stop is None else (stop - start) * _INDEX_RECORD.size)
+        except FileNotFoundError:
+            return []
+        raw = raw[:len(raw) - len(raw) % _INDEX_RECORD.size]
+        return [SegmentEntry(*record) for record in _INDEX_RECORD.iter_unpack(raw)]
+
+    async def index(self, student_id: str, session_id: str) -> List[SegmentEntry]:
+        """Every chunk of the session, in the order it was appended."""
+        return await asyncio.to_thread(self._read_index, self.paths(student_id, session_id)[1])
+
+    async def read_chunk(self, student_id: str, session_id: str, entry: SegmentEntry) -> bytes:
+        data_path = self.paths(student_id, session_id)[0]
+
+        def read() -> bytes:
+            fd = os.open(data_path, os.O_RDONLY)
+            try:
+                return os.pread(fd, entry.length, entry.offset)
+            finally:
+                os.close(fd)
+
+        return await asyncio.to_thread(read)
+
+    @contextmanager
+    def mapped(self, student_id: str, session_id: str) -> Iterator[Tuple[mmap.mmap, List[SegmentEntry]]]:
+        """Memory-map a session's data file (blocking; meant for analysis jobs, not request handlers)."""
+        data_path, index_path = self.paths(student_id, session_id)
+        entries = self._read_index(index_path)
+        with open(data_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped, entries
+
+    async def assemble(self, student_id: str, session_id: str, extension: str = "webm") -> Tuple[Path, int, List[int]]:
+        """
+        Write the session's chunks, ordered by sequence number, into one finalized file.
+        MediaRecorder chunks of one recording concatenate into a playable WebM. Returns
+        (path, size in bytes, missing sequence numbers).
+        """
+        data_path, index_path = self.paths(student_id, session_id)
+        target = self.final_path(student_id, session_id, extension)
+
+        def assemble() -> Tuple[int, List[int]]:
+            entries = sorted({entry.seq: entry for entry in reversed(self._read_index(index_path))}.values())
+            partial = target.with_name(target.name + ".part")
+            size = 0
+            with open(partial, "wb") as out:
+                if entries:
+                    with open(data_path, "rb") as f:
+                        for entry in entries:
+                            f.seek(entry.offset)
+                            out.write(f.read(entry.length))
+                            size += entry.length
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(partial, target)
+            seqs = [entry.seq for entry in entries]
+            missing = sorted(set(range(seqs[0], seqs[-1] + 1)) - set(seqs)) if seqs else []
+            return size, missing
+
+        async with self._lock(student_id, session_id):
+            size, missing = await asyncio.to_thread(assemble)
+        return target, size, missing
+
+    async def delete_raw(self, student_id: str, session_id: str) -> None:
+        """Remove a session's data and index files (after it has been assembled)."""
+        async with self._lock(student_id, session_id):
+            self._seqs.pop((student_id, session_id), None)
+            await asyncio.to_thread(self._unlink, *self.paths(student_id, session_id))
+
+    async def delete(self, student_id: str, session_id: str, extension: str = "webm") -> None:
+        """Remove everything stored for a session, including the assembled file."""
+        await self.delete_raw(student_id, session_id)
+        await asyncio.to_thread(self._unlink, self.final_path(student_id, session_id, extension))
+
+    @staticmethod
+    def _unlink(*paths: Path) -> None:
+        for path in paths:
+            path.unlink(missing_ok=True)
@@ -4,18 +4,23 @@ set -e
 # Start the FastAPI backend
 cd /backend || { echo "Backend directory not found"; exit 1; }
 
-echo "Starting FastAPI backend"
-# Start Uvicorn with proper host binding
-uvicorn server:app --host 0.0.0.0 --port 8001 &
+echo "Starting FastAPI backend with ${WEB_CONCURRENCY:=auto} worker(s)"
+export WEB_CONCURRENCY
+# serve.py runs Uvicorn on 0.0.0.0:8001 with WEB_CONCURRENCY worker processes
+python3 serve.py &
 BACKEND_PID=$!
 
 echo "Waiting for backend to start..."
-sleep 30
-
-if ! kill -0 $BACKEND_PID 2>/dev/null; then
-    echo "Backend failed to start at initialization, exiting"
-    exit 1
-fi
+for _ in $(seq 1 60); do
+    if ! kill -0 $BACKEND_PID 2>/dev/null; then
+        echo "Backend failed to start at initialization, exiting"
+        exit 1
+    fi
+    if wget -qO- http://127.0.0.1:8001/healthz >/dev/null 2>&1; then
+        break
+    fi
+    sleep 1
+done
 
 # Start Nginx
 nginx -g 'daemon off;' &
@@ -40,39 +40,18 @@ const Home = () => {
 
     useEffect(() => {
         if (studentId) {
-            const fetchModules = async () => {
+            const fetchStudentModules = async () => {
                 try {
-                    const response = await axios.get(`${API}/modules`);
-                    setModules(response.data);
+                    // Modules come back with `locked` already evaluated against this student's progress
+                    const response = await axios.get(`${API}/students/${studentId}/modules`);
+                    setModules(response.data.modules);
+                    setStudentProgress(response.data.progress);
                 } catch (error) {
                     console.error("Failed to fetch modules:", error);
                 }
             };
 
-            const fetchProgress = async () => {
-                try {
-                    const response = await axios.get(`${API}/progress/${studentId}`);
-                    setStudentProgress(response.data);
-
-                    if (response.data.length > 0) {
-                        const completedModuleNames = response.data
-                            .filter(p => p.completed)
-                            .map(p => p.module_name);
-
-                        setModules(prevModules =>
-                            prevModules.map(module => ({
-                                ...module,
-                                locked: module.requirements && !module.requirements.every(req => completedModuleNames.includes(req))
-                            }))
-                        );
-                    }
-                } catch (error) {
-                    console.error("Failed to fetch progress:", error);
-                }
-            };
-
-            fetchModules();
-            fetchProgress();
+            fetchStudentModules();
         }
     }, [studentId, API]); // Added API to dependency array as it's used in fetch
 
@@ -137,19 +116,53 @@ const Home = () => {
     };
 
     const processLearningChatStep = async (message) => {
+        let receivedTokens = false;
         try {
-            const context = messages.map(m => ({ role: m.role, content: m.content }));
-            const currentContext = [...context, { role: "student", content: message }];
-
-            const response = await axios.post(`${API}/chat`, {
-                student_id: studentId,
-                message: message,
-                context: currentContext
+            // Stream the reply over Server-Sent Events so the first words show up as soon as Gemini produces them
+            const response = await fetch(`${API}/chat/stream`, {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                // The backend keeps the conversation history, so only the new message is sent
+                body: JSON.stringify({
+                    student_id: studentId,
+                    message: message
+                })
             });
-            setMessages(prev => [
-                ...prev,
-                { role: "tutor", content: response.data.response }
-            ]);
+            if (!response.ok || !response.body) {
+                throw new Error(`Chat stream failed with status ${response.status}`);
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = "";
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split("\n\n");
+                buffer = events.pop();
+                for (const rawEvent of events) {
+                    const eventLine = rawEvent.split("\n").find(line => line.startsWith("event: "));
+                    const dataLine = rawEvent.split("\n").find(line => line.startsWith("data: "));
+                    if (!dataLine) continue;
+                    const data = JSON.parse(dataLine.slice("data: ".length));
+                    if (eventLine === "event: error") {
+                        throw new Error(data.detail);
+                    }
+                    if (data.token) {
+                        if (!receivedTokens) {
+                            receivedTokens = true;
+                            setIsProcessing(false);
+                            setMessages(prev => [...prev, { role: "tutor", content: data.token }]);
+                        } else {
+                            setMessages(prev => [
+                                ...prev.slice(0, -1),
+                                { ...prev[prev.length - 1], content: prev[prev.length - 1].content + data.token }
+                            ]);
+                        }
+                    }
+                }
+            }
         } catch (error) {
             console.error("Error chatting with tutor:", error);
             setMessages(prev => [
@@ -201,85 +214,12 @@ const Home = () => {
                 score: score
             });
 
-            setStudentProgress(prev => {
-                const existing = prev.find(p => p.module_id === selectedModule.id);
-                if (existing) {
-                    return prev.map(p =>
-                        p.module_id === selectedModule.id
-                            ? { ...p, completed, score }
-                            : p
-                    );
-                } else {
-                    return [...prev, {
-                        module_id: selectedModule.id,
-                        module_name: selectedModule.name,
-                        completed,
-                        score
-                    }];
-                }
-            });
+            // The server re-evaluates which modules this result unlocked
+            const response = await axios.get(`${API}/students/${studentId}/modules`);
+            setModules(response.data.modules);
+            setStudentProgress(response.data.progress);
 
             if (completed) {
-                setModules(prevModules =>
-                    prevModules.map(module => {
-                        // This logic might need adjustment if requirements can be cross-module name based
-                        // and not just relying on selectedModule.name if module names are unique and map to IDs.
-                        // For now, assuming module.requirements contains names of other modules that must be completed.
-                        const updatedRequirements = module.requirements?.filter(reqName => reqName !== selectedModule.name);
-
-                        let isStillLocked = false;
-                        if (updatedRequirements && updatedRequirements.length > 0) {
-                            // Check if all *remaining* requirements are met
-                            const completedModuleNames = studentProgress
-                                .filter(p => p.completed)
-                                .map(p => p.module_name)
-                                .concat(selectedModule.name); // include the just completed module
-
-                            isStillLocked = !updatedRequirements.every(req => completedModuleNames.includes(req));
-                        }
-
-
-                        if (module.requirements && module.requirements.includes(selectedModule.name)) {
-                            // Re-evaluate locking based on all progress
-                            const allCompletedNames = studentProgress
-                                .filter(p => p.completed)
-                                .map(p => p.module_name)
-                                .concat(selectedModule.name); // include the just completed module
-
-                            const requirementsMet = module.requirements.every(req => allCompletedNames.includes(req));
-                            return { ...module, locked: !requirementsMet };
-                        }
-
-
-                        return module;
-                    })
-                );
-
-
-                // Refresh studentProgress to get the most up-to-date list for module unlocking logic
-                const progressResponse = await axios.get(`${API}/progress/${studentId}`);
-                const freshStudentProgress = progressResponse.data;
-                setStudentProgress(freshStudentProgress);
-
-                setModules(prevModules =>
-                    prevModules.map(m => {
-                        if (!m.requirements || m.requirements.length === 0) {
-                            return { ...m, locked: false };
-                        }
-                        const completedNames = freshStudentProgress
-                            .filter(p => p.completed)
-                            .map(p => p.module_name);
-                        // if selectedModule was just completed, add it to completedNames for this check
-                        if (completed && selectedModule && !completedNames.includes(selectedModule.name)) {
-                            completedNames.push(selectedModule.name);
-                        }
-
-                        const allReqsMet = m.requirements.every(req => completedNames.includes(req));
-                        return { ...m, locked: !allReqsMet };
-                    })
-                );
-
-
                 setMessages(prev => [
                     ...prev,
                     {
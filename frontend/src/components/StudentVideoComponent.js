@@ -12,37 +12,49 @@ const StudentVideoComponent = ({ isCameraActive, studentId }) => {
     const [isRecording, setIsRecording] = useState(false);
     const [processingData, setProcessingData] = useState(false);
 
-    const processingRef = useRef(false);
+    // Uploads run one at a time, in recording order, so no chunk is dropped while another is in flight
+    const uploadQueueRef = useRef(Promise.resolve());
+    const pendingUploadsRef = useRef(0);
 
-    const sendDataChunk = useCallback(async (dataChunk) => {
-        if (processingRef.current || !dataChunk || dataChunk.size === 0) return;
-
-        processingRef.current = true;
+    const enqueueUpload = useCallback((upload) => {
+        pendingUploadsRef.current += 1;
         setProcessingData(true);
-
-        const reader = new FileReader();
-        reader.readAsDataURL(dataChunk);
-        reader.onloadend = async () => {
-            const base64data = reader.result;
+        uploadQueueRef.current = uploadQueueRef.current
+            .then(upload)
+            .catch((error) => console.error("Failed to send video data:", error))
+            .finally(() => {
+                pendingUploadsRef.current -= 1;
+                if (pendingUploadsRef.current === 0) setProcessingData(false);
+            });
+    }, []);
+
+    const sendDataChunk = useCallback((session, dataChunk) => {
+        if (!dataChunk || dataChunk.size === 0) return;
+        const seq = session.nextSeq++;
+
+        enqueueUpload(async () => {
+            const sessionId = await session.ready;
+            const send = () => axios.post(`${API}/video/sessions/${sessionId}/chunks`, dataChunk, {
+                params: { student_id: studentId, seq },
+                // Send the Blob as the raw request body; no base64 data URL, no JSON wrapping
+                headers: { "Content-Type": dataChunk.type || "video/webm" }
+            });
             try {
-                await axios.post(`${API}/process-video-frame`, {
-                    student_id: studentId,
-                    frame_data: base64data,
-                    mime_type: dataChunk.type || "video/webm"
-                });
+                await send();
             } catch (error) {
-                console.error("Failed to send data chunk:", error);
-            } finally {
-                processingRef.current = false;
-                setProcessingData(false);
+                // Retrying is safe: the server ignores a sequence number it already has
+                await send();
             }
-        };
-        reader.onerror = (error) => {
-            console.error("Error converting blob to base64:", error);
-            processingRef.current = false;
-            setProcessingData(false);
-        };
-    }, [studentId]); // API dependency removed as it's now in-scope
+        });
+    }, [enqueueUpload, studentId]);
+
+    const stopSession = useCallback((session) => {
+        // Queued after the last chunk, so the server reassembles a complete recording
+        enqueueUpload(async () => {
+            const sessionId = await session.ready;
+            await axios.post(`${API}/video/sessions/${sessionId}/stop`, null, { params: { student_id: studentId } });
+        });
+    }, [enqueueUpload, studentId]);
 
     useEffect(() => {
         if (isCameraActive && webcamRef.current && studentId) {
@@ -55,9 +67,19 @@ const StudentVideoComponent = ({ isCameraActive, studentId }) => {
 
                 mediaRecorderRef.current = new MediaRecorder(webcamRef.current.stream, options);
 
+                // One server-side recording session per MediaRecorder run
+                const session = {
+                    nextSeq: 0,
+                    ready: axios.post(`${API}/video/sessions`, {
+                        student_id: studentId,
+                        mime_type: mediaRecorderRef.current.mimeType || "video/webm"
+                    }).then(response => response.data.session_id)
+                };
+                session.ready.catch((error) => console.error("Failed to start video session:", error));
+
                 mediaRecorderRef.current.ondataavailable = (event) => {
                     if (event.data && event.data.size > 0) {
-                        sendDataChunk(event.data);
+                        sendDataChunk(session, event.data);
                     }
                 };
 
@@ -67,6 +89,7 @@ const StudentVideoComponent = ({ isCameraActive, studentId }) => {
 
                 mediaRecorderRef.current.onstop = () => {
                     setIsRecording(false);
+                    stopSession(session);
                 };
 
                 mediaRecorderRef.current.onerror = (event) => {
@@ -90,9 +113,8 @@ const StudentVideoComponent = ({ isCameraActive, studentId }) => {
             }
             mediaRecorderRef.current = null; // Clean up MediaRecorder instance
             setIsRecording(false);       // Reset recording state
-            setProcessingData(false);    // Reset processing state
         };
-    }, [isCameraActive, studentId, sendDataChunk]);
+    }, [isCameraActive, studentId, sendDataChunk, stopSession]);
 
     return (
         <div className="relative w-full h-full rounded-lg overflow-hidden bg-gray-200">
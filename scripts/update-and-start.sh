@@ -91,7 +91,13 @@ fi
 
 # Wait for services to start up
 echo "Waiting for services to start up..."
-sleep 5
+for _ in $(seq 1 30); do
+    if curl -sf http://127.0.0.1:8001/readyz >/dev/null 2>&1; then
+        echo "Backend is ready (WEB_CONCURRENCY=${WEB_CONCURRENCY:-1} worker(s))"
+        break
+    fi
+    sleep 1
+done
 
 # Show logs for both services
 show_logs "backend"
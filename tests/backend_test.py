@@ -0,0 +1,527 @@
+"""
+Backend tests. The app runs in-process with the fake LLM provider and an in-memory
+MongoDB (mongomock-motor), so no API key or database is needed:
+
+    pip install -r backend/requirements-dev.txt
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+# server reads its configuration at import time
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ["FAKE_LLM_LATENCY"] = "0"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+import server  # noqa: E402
+from answer_cache import AnswerCache  # noqa: E402
+from conversation import ConversationMemory  # noqa: E402
+from db_indexes import IndexBuildError, ensure_indexes  # noqa: E402
+from external_integrations.llm import (  # noqa: E402
+    CircuitBreaker,
+    FakeLLMProvider,
+    LLMExecutor,
+    LLMOverloadedError,
+    LLMUnavailableError,
+    ResilientLLM,
+)
+from singleflight import SingleFlight  # noqa: E402
+
+WEBM_HEADER = b"\x1a\x45\xdf\xa3" + b"\x00" * 12
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    # One lifespan for the module: shutting the app down also shuts the LLM thread pool
+    server.db.use(AsyncMongoMockClient()["tutor_test"])
+    server.video_store.root = tmp_path_factory.mktemp("video_uploads")
+    with TestClient(server.app) as test_client:
+        test_client.portal.call(asyncio.gather, *server.startup_tasks)
+        yield test_client
+
+
+@pytest.fixture
+def student(client):
+    return _create_student(client)
+
+
+def _create_student(client):
+    response = client.post("/api/students", json={"name": "Ada", "grade": "5", "interests": ["chess"]})
+    assert response.status_code == 200
+    return response.json()
+
+
+# LLM resilience
+
+class StallingProvider(FakeLLMProvider):
+    """The first call takes `stall` seconds; later calls answer at once."""
+
+    def __init__(self, stall: float):
+        super().__init__()
+        self.stall = stall
+
+    def generate(self, system_instruction, history, message):
+        self._begin_call()
+        if self.calls == 1:
+            time.sleep(self.stall)
+        return self.reply_for(history, message)
+
+
+def test_llm_retries_a_failed_attempt():
+    async def scenario():
+        provider = FakeLLMProvider(fail_first=1)
+        llm = ResilientLLM(provider, LLMExecutor(), retries=1, backoff=0)
+        reply = await llm.generate(None, [], "what is a fraction")
+        return provider, llm, reply
+
+    provider, llm, reply = asyncio.run(scenario())
+    assert reply == provider.reply_for([], "what is a fraction")
+    assert provider.calls == 2
+    assert llm.retried == 1
+    assert llm.breaker.state == "closed"
+
+
+def test_llm_breaker_opens_and_fails_fast():
+    async def scenario():
+        provider = FakeLLMProvider(fail_first=100)
+        llm = ResilientLLM(provider, LLMExecutor(), retries=0,
+                           breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        for _ in range(2):
+            with pytest.raises(LLMUnavailableError):
+                await llm.generate(None, [], "hi there tutor")
+        with pytest.raises(LLMUnavailableError, match="circuit breaker is open"):
+            await llm.generate(None, [], "hi there tutor")
+        return provider, llm
+
+    provider, llm = asyncio.run(scenario())
+    assert provider.calls == 2  # the third call never reached the provider
+    assert llm.breaker.state == "open"
+
+
+def test_llm_breaker_closes_after_a_successful_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()  # the half-open trial
+    assert not breaker.allow()  # only one at a time
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_llm_hedge_answers_when_the_primary_stalls():
+    async def scenario():
+        llm = ResilientLLM(StallingProvider(stall=2.0), LLMExecutor(), deadline=5, hedge_after=0.05)
+        started = time.perf_counter()
+        reply = await llm.generate(None, [], "what is a prime number")
+        return llm, reply, time.perf_counter() - started
+
+    llm, reply, elapsed = asyncio.run(scenario())
+    assert reply.endswith("what is a prime number")
+    assert llm.hedges == 1
+    assert elapsed < 1.5
+
+
+def test_llm_deadline_starts_once_a_slot_is_held():
+    async def scenario():
+        llm = ResilientLLM(FakeLLMProvider(latency=0.1), LLMExecutor(max_concurrency=1), deadline=0.3, retries=0)
+        replies = await asyncio.gather(*(llm.generate(None, [], f"question {i}") for i in range(6)))
+        chunks = await asyncio.gather(*(_collect(llm.stream(None, [], f"question {i}")) for i in range(4)))
+        return llm, replies, chunks
+
+    llm, replies, chunks = asyncio.run(scenario())
+    # Every call queued well past the deadline, but each one ran within it
+    assert len(replies) == 6
+    assert all("".join(parts).endswith(f"question {i}") for i, parts in enumerate(chunks))
+    assert llm.breaker.failures == 0
+    assert llm.retried == 0
+
+
+def test_llm_slot_wait_timeout_is_overloaded_and_not_a_breaker_failure():
+    release = threading.Event()
+
+    async def scenario():
+        executor = LLMExecutor(max_concurrency=1, queue_timeout=0.05)
+        provider = FakeLLMProvider()
+        llm = ResilientLLM(provider, executor, hedge_after=0.01, breaker=CircuitBreaker(failure_threshold=1))
+        busy = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.01)
+        with pytest.raises(LLMOverloadedError):
+            await llm.generate(None, [], "what is a fraction")
+        release.set()
+        await busy
+        return provider, llm
+
+    provider, llm = asyncio.run(scenario())
+    assert provider.calls == 0
+    assert llm.breaker.state == "closed"
+    assert llm.hedges == 0  # the primary never held a slot, so there was nothing to hedge
+    assert llm.retried == 0
+
+
+async def _collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+# LLM executor
+
+def test_executor_slot_held_until_the_thread_finishes():
+    release = threading.Event()
+
+    async def scenario():
+        executor = LLMExecutor(max_concurrency=1, max_queue=0, queue_timeout=0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(executor.run(release.wait), 0.05)
+        # The caller gave up but the thread still runs: its slot is not free
+        assert executor.stats["running"] == 1
+        with pytest.raises(LLMOverloadedError):
+            await executor.run(lambda: None)
+        release.set()
+        for _ in range(100):
+            if executor.stats["running"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert executor.stats["running"] == 0
+        assert await executor.run(lambda: "free again") == "free again"
+
+    asyncio.run(scenario())
+
+
+def test_executor_abandoned_stream_frees_its_slot_when_the_pump_stops():
+    def slow_words():
+        for word in ["one", "two", "three", "four"]:
+            time.sleep(0.05)
+            yield word
+
+    async def scenario():
+        executor = LLMExecutor(max_concurrency=1)
+        stream = executor.stream(slow_words)
+        assert await stream.__anext__() == "one"
+        await stream.aclose()
+        assert executor.stats["running"] == 1
+        for _ in range(100):
+            if executor.stats["running"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert executor.stats["running"] == 0
+
+    asyncio.run(scenario())
+
+
+# Single flight
+
+def test_single_flight_followers_wait_a_bounded_time_then_take_over():
+    async def scenario():
+        flight = SingleFlight(follower_timeout=0.05)
+        leader, abandoned = flight.begin("turn")
+        assert leader
+        follower, shared = flight.begin("turn")
+        assert not follower
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.wait(shared)
+        # Nobody finished the key: the next caller becomes the leader
+        leader, _ = flight.begin("turn")
+        assert leader
+        assert isinstance(abandoned.exception(), asyncio.TimeoutError)
+
+    asyncio.run(scenario())
+
+
+def test_chat_duplicates_share_one_turn(client, student):
+    async def send_twice():
+        send = lambda: server.chat_with_tutor(  # noqa: E731
+            student_id=student["id"], message="how do plants grow", context=None, module_id=None,
+            standalone=False, client_request_id=None, idempotency_key="retry-1",
+        )
+        return await asyncio.gather(send(), send())
+
+    coalesced = server.chat_requests.coalesced
+    first, second = client.portal.call(send_twice)
+    assert first == second
+    assert server.chat_requests.coalesced == coalesced + 1
+    messages = client.get(f"/api/messages/{student['id']}").json()
+    assert [m["role"] for m in messages] == ["tutor", "student"]
+
+
+def test_chat_stream_closed_mid_reply_releases_its_key(client, student):
+    async def open_and_abandon():
+        response = await server.chat_with_tutor_stream(
+            student_id=student["id"], message="tell me about volcanoes", context=None, module_id=None,
+            standalone=False, client_request_id=None, idempotency_key="stream-1",
+        )
+        await response.body_iterator.__anext__()
+        # What Starlette does when the client goes away during a send
+        await response.body_iterator.aclose()
+
+    client.portal.call(open_and_abandon)
+    assert server.chat_requests.stats["in_flight"] == 0
+    retry = client.post("/api/chat/stream", headers={"Idempotency-Key": "stream-1"},
+                        json={"student_id": student["id"], "message": "tell me about volcanoes"})
+    assert retry.status_code == 200
+    assert "event: done" in retry.text
+
+
+# Messages
+
+def test_messages_keyset_pagination(client, student):
+    for i in range(7):
+        client.post("/api/messages", json={"student_id": student["id"], "content": f"note {i}", "role": "student"})
+
+    pages, prev_cursors, cursor = [], [], None
+    while True:
+        params = {"limit": 3, **({"before": cursor} if cursor else {})}
+        response = client.get(f"/api/messages/{student['id']}", params=params)
+        assert response.status_code == 200
+        pages.append([m["content"] for m in response.json()])
+        prev_cursors.append(response.headers.get("X-Prev-Cursor"))
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert pages == [["note 6", "note 5", "note 4"], ["note 3", "note 2", "note 1"], ["note 0"]]
+    assert prev_cursors[0] is None  # nothing is newer than the first page
+
+    newer = client.get(f"/api/messages/{student['id']}", params={"limit": 3, "after": prev_cursors[1]})
+    assert [m["content"] for m in newer.json()] == pages[0]
+    assert client.get(f"/api/messages/{student['id']}", params={"before": "not-a-cursor"}).status_code == 400
+
+
+# Progress
+
+def test_progress_upsert_keeps_one_record_per_module(client, student):
+    update = {"student_id": student["id"], "module_id": "m-1", "module_name": "Fractions", "completed": False, "score": 0.4}
+    first = client.post("/api/progress", json=update).json()
+    second = client.post("/api/progress", json={**update, "completed": True, "score": None}).json()
+    assert second["id"] == first["id"]
+    assert second["completed"] is True
+    assert second["score"] == 0.4  # a missing score leaves the stored one alone
+    assert len(client.get(f"/api/progress/{student['id']}").json()) == 1
+
+
+def test_progress_batch_applies_the_latest_update_per_module(client, student):
+    updates = [
+        {"student_id": student["id"], "module_id": "m-1", "module_name": "Fractions", "completed": False, "score": 0.2},
+        {"student_id": student["id"], "module_id": "m-2", "module_name": "Decimals", "completed": True, "score": 0.9},
+        {"student_id": student["id"], "module_id": "m-1", "module_name": "Fractions", "completed": True, "score": 0.7},
+    ]
+    response = client.post("/api/progress/batch", json={"updates": updates})
+    assert response.status_code == 200
+    records = {r["module_id"]: r for r in client.get(f"/api/progress/{student['id']}").json()}
+    assert set(records) == {"m-1", "m-2"}
+    assert (records["m-1"]["completed"], records["m-1"]["score"]) == (True, 0.7)
+    assert client.post("/api/progress/batch", json={"updates": []}).status_code == 422
+
+
+def test_index_bootstrap_refuses_duplicate_progress_rows():
+    async def scenario():
+        db = AsyncMongoMockClient()["tutor_duplicates"]
+        row = {"student_id": "s1", "module_id": "m1", "module_name": "Fractions", "completed": False}
+        await db.progress.insert_many([{**row, "id": "p1"}, {**row, "id": "p2", "completed": True}])
+        with pytest.raises(IndexBuildError, match="progress.student_module_unique") as raised:
+            await ensure_indexes(db)
+        assert "'student_id': 's1'" in str(raised.value)
+        # The other indexes were still built
+        return await db.students.index_information()
+
+    assert "id_unique" in asyncio.run(scenario())
+
+
+# Module catalog
+
+def test_modules_etag_answers_304_when_unchanged(client):
+    response = client.get("/api/modules")
+    assert response.status_code == 200
+    assert response.json()
+    etag = response.headers["ETag"]
+    cached = client.get("/api/modules", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert client.get("/api/modules", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+# Video sessions
+
+def _wait_for_status(client, student_id: str, session_id: str, status: str) -> dict:
+    for _ in range(100):
+        session = client.get(f"/api/video/sessions/{session_id}", params={"student_id": student_id}).json()
+        if session.get("status") == status:
+            return session
+        time.sleep(0.02)
+    raise AssertionError(f"session {session_id} never became {status}")
+
+
+def test_video_sessions_are_private_to_their_student(client, student):
+    other = client.post("/api/students", json={"name": "Bo"}).json()
+    session_id = client.post("/api/video/sessions", json={"student_id": student["id"]}).json()["session_id"]
+
+    chunk = client.post(f"/api/video/sessions/{session_id}/chunks", params={"student_id": other["id"], "seq": 0},
+                        content=b"x")
+    assert chunk.status_code == 404
+    assert client.post(f"/api/video/sessions/{session_id}/stop", params={"student_id": other["id"]}).status_code == 404
+    assert client.get(f"/api/video/sessions/{session_id}", params={"student_id": other["id"]}).status_code == 404
+    assert _wait_for_status(client, student["id"], session_id, "recording")["chunk_count"] == 0
+
+
+def test_video_session_chunks_are_assembled_in_order(client, student):
+    session_id = client.post("/api/video/sessions", json={"student_id": student["id"]}).json()["session_id"]
+    url = f"/api/video/sessions/{session_id}/chunks"
+    for seq, body in [(1, b"second"), (0, b"first-"), (1, b"second")]:
+        response = client.post(url, params={"student_id": student["id"], "seq": seq}, content=body)
+        assert response.status_code == 200
+    assert response.json()["duplicate"] is True
+
+    client.post(f"/api/video/sessions/{session_id}/stop", params={"student_id": student["id"]})
+    session = _wait_for_status(client, student["id"], session_id, "finalized")
+    assert session["chunk_count"] == 2
+    assert session["missing_count"] == 0
+    final = server.video_store.final_path(student["id"], session_id)
+    assert final.read_bytes() == b"first-second"
+
+
+def test_video_uploads_without_a_session_get_one_per_recorder_run(client, student):
+    def upload(body: bytes) -> str:
+        response = client.post("/api/video/chunks", params={"student_id": student["id"]}, content=body,
+                               headers={"Content-Type": "video/webm"})
+        assert response.status_code == 200
+        return response.json()["session_id"]
+
+    first_run = [upload(WEBM_HEADER), upload(b"cluster-1"), upload(b"cluster-2")]
+    second_run = [upload(WEBM_HEADER), upload(b"cluster-1")]
+    assert len(set(first_run)) == 1 and len(set(second_run)) == 1
+    assert first_run[0] != second_run[0]
+
+    # A new run stops the previous one, which then holds exactly one header
+    _wait_for_status(client, student["id"], first_run[0], "finalized")
+    final = server.video_store.final_path(student["id"], first_run[0]).read_bytes()
+    assert final == WEBM_HEADER + b"cluster-1cluster-2"
+
+    other = client.post("/api/students", json={"name": "Bo"}).json()
+    response = client.post("/api/video/chunks", params={"student_id": other["id"]}, content=b"cluster-1")
+    assert response.json()["session_id"] not in first_run + second_run
+
+
+# Chat over a WebSocket
+
+def test_chat_socket_answers_turns_and_survives_binary_frames(client, student):
+    with client.websocket_connect(f"/api/ws/chat/{student['id']}") as socket:
+        assert socket.receive_json()["type"] == "ready"
+
+        socket.send_bytes(b"\x00\x01")
+        error = socket.receive_json()
+        assert error == {"type": "error", "detail": "Frames must be text, not binary"}
+
+        socket.send_json({"type": "message", "content": "why is the sky blue"})
+        events = []
+        while not events or events[-1]["type"] != "done":
+            events.append(socket.receive_json())
+        tokens = "".join(e["token"] for e in events if e["type"] == "token")
+        assert tokens == events[-1]["response"]
+        assert tokens.endswith("why is the sky blue")
+
+        socket.send_json({"type": "ping"})
+        while (event := socket.receive_json())["type"] != "pong":
+            assert event["type"] == "typing"
+
+    roles = [m["role"] for m in client.get(f"/api/messages/{student['id']}").json()]
+    assert roles == ["tutor", "student"]
+
+
+# Answer cache
+
+def test_answer_cache_near_duplicates_need_the_same_content_words():
+    cache = AnswerCache(near_duplicates=True)
+    cache.put("what is the answer to 7 times 9", "3", "math", "63")
+    cache.put("where is austria on the map", "3", "geo", "In central Europe")
+    assert cache.get("What's the answer to 7 times 9?", "3", "math") == "63"
+    assert cache.get("what is the answer to 7 times 8", "3", "math") is None
+    assert cache.get("where is australia on the map", "3", "geo") is None
+    assert cache.get("what is 7 x 9", "4", "math") is None  # another grade
+
+
+@pytest.fixture
+def answer_cache(client):
+    # Off by default
+    previous = server.answer_cache
+    server.answer_cache = AnswerCache()
+    yield server.answer_cache
+    server.answer_cache = previous
+
+
+def _socket_reply(socket, frame):
+    socket.send_json(frame)
+    while (event := socket.receive_json())["type"] != "done":
+        pass
+    return event["response"]
+
+
+def test_answer_cache_never_answers_a_turn_with_history(client, answer_cache):
+    question = "my answer is 12"
+    first = client.post("/api/chat", json={"student_id": _create_student(client)["id"], "message": question})
+    cached = first.json()["response"]
+    assert answer_cache.stats["entries"] == 1
+
+    def follow_up(student_id):
+        return client.post("/api/chat", json={"student_id": student_id, "message": "what is 3 times 4"})
+
+    over_chat = _create_student(client)["id"]
+    follow_up(over_chat)
+    reply = client.post("/api/chat", json={"student_id": over_chat, "message": question}).json()["response"]
+    assert reply != cached
+
+    over_stream = _create_student(client)["id"]
+    follow_up(over_stream)
+    streamed = client.post("/api/chat/stream", json={"student_id": over_stream, "message": question}).text
+    assert "event: done" in streamed
+    assert cached not in streamed
+
+    over_socket = _create_student(client)["id"]
+    with client.websocket_connect(f"/api/ws/chat/{over_socket}") as socket:
+        assert socket.receive_json()["type"] == "ready"
+        _socket_reply(socket, {"type": "message", "content": "what is 3 times 4"})
+        assert _socket_reply(socket, {"type": "message", "content": question}) != cached
+        # Unless the client says the question stands on its own
+        assert _socket_reply(socket, {"type": "message", "content": question, "standalone": True}) == cached
+
+    # Only the two first-turn questions were stored
+    assert answer_cache.stats["entries"] == 2
+
+
+# Conversation memory
+
+def test_conversation_folds_in_batches():
+    calls = []
+
+    async def summarize(summary, turns):
+        calls.append(len(turns))
+        return "summary"
+
+    async def scenario():
+        db = AsyncMongoMockClient()["memory_test"]
+        memory = ConversationMemory(db, summarize, token_budget=100, max_turns=50)
+        started = time.time()
+        for i in range(40):
+            await db.messages.insert_one({
+                "id": str(i), "student_id": "s", "role": "tutor" if i % 2 else "student",
+                "content": "x" * 40, "timestamp": server.datetime.utcfromtimestamp(started + i),
+            })
+            window = await memory.load("s")
+            assert sum(len(turn["content"]) for turn in window.turns) // 4 <= 100
+            memory.schedule_fold("s", window)
+            await memory.wait_for_folds()
+
+    asyncio.run(scenario())
+    # Each fold takes several turns, so most turns need no summarization call
+    assert 0 < len(calls) <= 8
+    assert all(count > 1 for count in calls)